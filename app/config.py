@@ -1,4 +1,5 @@
 """Paths for credentials and cookies (relative to project root)."""
+import os
 from pathlib import Path
 
 ROOT = Path(__file__).resolve().parent.parent
@@ -8,6 +9,8 @@ TOKEN_FILE = ROOT / "token.json"
 
 LOGIN_URL = "http://salchimonster.restaurant.pe/restaurant/#!/login"
 LOGIN_API_URL = "http://salchimonster.restaurant.pe/restaurant/m/rest/usuario/login"
+# Solo desarrollo: HAR con los estáticos de la página de login (se graba si no existe, luego se reproduce)
+LOGIN_HAR_PATH = os.environ.get("LOGIN_HAR_PATH") or None
 
 REPORT_URL = "http://salchimonster.restaurant.pe/restaurant/api/reports/report.php"
 LOCALES_API_URL = "http://salchimonster.restaurant.pe/restaurant/api/rest/local/getLocalesPermitidos/0"
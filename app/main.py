@@ -7,10 +7,15 @@ from __future__ import annotations
 import asyncio
 import json
 import logging
+import mimetypes
+import os
 import queue
 import re
 import shutil
+import stat as stat_mod
 import sys
+import threading
+import time
 import traceback
 import uuid as uuid_mod
 from pathlib import Path
@@ -21,6 +26,11 @@ try:
 except ImportError:
     ZoneInfo = None  # type: ignore
 
+try:
+    import orjson
+except ImportError:
+    orjson = None  # type: ignore
+
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
@@ -36,11 +46,13 @@ if str(_PROJECT_ROOT) not in sys.path:
 from datetime import datetime, timedelta, timezone
 from urllib.parse import urlencode
 
-from contextlib import asynccontextmanager
+from collections import Counter
+from contextlib import asynccontextmanager, contextmanager
+from functools import lru_cache
 
 from fastapi import FastAPI, File, HTTPException, Query, Request, UploadFile, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse, Response
+from fastapi.responses import FileResponse, JSONResponse, ORJSONResponse, Response
 from pydantic import BaseModel
 
 from app.config import (
@@ -49,6 +61,7 @@ from app.config import (
     TOKEN_FILE,
     LOGIN_URL,
     LOGIN_API_URL,
+    LOGIN_HAR_PATH,
     REPORT_URL,
     LOCALES_API_URL,
     REPORTS_DIR,
@@ -82,12 +95,7 @@ def _resolve_local_name(sede: str) -> str:
     Si ya es un nombre (o ADMIN) lo devuelve tal cual."""
     if not sede or not sede.strip().isdigit():
         return sede
-    locales = _read_json(REPORTS_LOCALES_JSON, [])
-    if isinstance(locales, list):
-        for loc in locales:
-            if str(loc.get("id", "")) == sede.strip():
-                return loc.get("name", sede)
-    return sede
+    return _locales_cached()["name_by_id"].get(sede.strip(), sede)
 
 
 def _read_notificaciones() -> dict:
@@ -144,6 +152,21 @@ def _create_notificacion(
     return notif
 
 
+# Cliente HTTP compartido (pool keep-alive) para la API del restaurante: schedulers y endpoints reutilizan conexiones
+_http_client: Any = None
+
+
+def _get_http_client() -> "httpx.AsyncClient":
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        import httpx
+        _http_client = httpx.AsyncClient(
+            timeout=60.0,
+            limits=httpx.Limits(max_keepalive_connections=32, max_connections=64),
+        )
+    return _http_client
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     global _notif_event_loop
@@ -160,15 +183,17 @@ async def lifespan(app: FastAPI):
         _migrate_old_deliverys_to_per_date()
     except Exception as e:
         logger.warning("Migración deliverys: %s", e)
-    # Deliverys por local cada 2 min (obtenerDeliverysPorLocalSimple; 5 s entre cada sede)
+    # Deliverys por local cada 2 min (obtenerDeliverysPorLocalSimple; varias sedes a la vez)
     deliverys_task = asyncio.create_task(_deliverys_scheduler_loop())
-    logger.info("Deliverys scheduler: iniciado (cada 2 min, fecha hoy; 5 s entre sedes)")
+    logger.info("Deliverys scheduler: iniciado (cada 2 min, fecha hoy; %s sedes en paralelo)", _DELIVERYS_CONCURRENCY)
     # Login cada 12 h para renovar sesión
     login_refresh_task = asyncio.create_task(_login_refresh_loop())
     logger.info("Login refresh: iniciado (cada 12 h)")
     # Sedes Didi: poda cada 5 s para marcar extensiones desconectadas (>36 s sin heartbeat)
     didi_sedes_task = asyncio.create_task(run_didi_sedes_prune_loop())
     logger.info("Didi sedes prune: iniciado (cada 5 s)")
+    # Estado del programador para /report/ws: un solo armado por segundo para todos los clientes
+    report_status_task = asyncio.create_task(_report_status_broadcast_loop())
     # Callback para merge cuando la extensión actualiza didi_restaurant_map (sin temporizador)
     app.state.on_didi_map_updated = _on_didi_map_updated
     yield
@@ -176,6 +201,7 @@ async def lifespan(app: FastAPI):
     deliverys_task.cancel()
     login_refresh_task.cancel()
     didi_sedes_task.cancel()
+    report_status_task.cancel()
     try:
         await locales_task
     except asyncio.CancelledError:
@@ -192,12 +218,20 @@ async def lifespan(app: FastAPI):
         await didi_sedes_task
     except asyncio.CancelledError:
         pass
+    try:
+        await report_status_task
+    except asyncio.CancelledError:
+        pass
+    if _http_client is not None:
+        await _http_client.aclose()
 
 
 app = FastAPI(
     title="Restaurant Scraper Login",
     description="Login con Chromium a salchimonster.restaurant.pe",
     lifespan=lifespan,
+    # Respuestas grandes (informes, reporte maestro, pedidos): orjson serializa mucho más rápido que json
+    default_response_class=ORJSONResponse if orjson is not None else JSONResponse,
 )
 app.add_middleware(
     CORSMiddleware,
@@ -219,19 +253,55 @@ app.include_router(didi_capture_router, tags=["didi-capture"])
 
 # --- Credenciales ---
 
+# Parseo de JSON desde bytes (archivos y cuerpos httpx): orjson si está instalado, sin decodificar a str antes
+_json_loads = orjson.loads if orjson is not None else json.loads
+
+
 def _read_json(path: Path, default: dict | list) -> dict | list:
     if not path.exists():
         return default
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except (json.JSONDecodeError, IOError):
+        return _json_loads(path.read_bytes())
+    except (ValueError, IOError):
         return default
 
 
 def _write_json(path: Path, data: dict | list) -> None:
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+    """Escribe en un temporal y renombra (os.replace): quien lea nunca ve un archivo a medio escribir."""
+    if orjson is not None:
+        raw = orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    else:
+        raw = json.dumps(data, indent=2, ensure_ascii=False).encode("utf-8")
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        tmp.write_bytes(raw)
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+_UPLOAD_CHUNK_BYTES = 1 << 20  # 1 MB
+
+
+def _copy_upload(src, dest: Path, max_size: int | None = None) -> bool:
+    """
+    Copia un archivo subido (UploadFile.file) a dest por bloques, sin cargarlo entero en memoria.
+    Devuelve False sin dejar nada en dest si supera max_size. Bloqueante: llamar con asyncio.to_thread.
+    """
+    tmp = dest.with_name(f"{dest.name}.{os.getpid()}.{threading.get_ident()}.part")
+    written = 0
+    try:
+        with tmp.open("wb") as out:
+            while chunk := src.read(_UPLOAD_CHUNK_BYTES):
+                written += len(chunk)
+                if max_size is not None and written > max_size:
+                    return False
+                out.write(chunk)
+        os.replace(tmp, dest)
+        return True
+    finally:
+        tmp.unlink(missing_ok=True)
 
 
 def get_credentials() -> dict[str, Any]:
@@ -247,18 +317,55 @@ def save_credentials(data: dict[str, Any]) -> dict[str, Any]:
     return data
 
 
+# Cache de archivos pequeños leídos en cada pasada de los schedulers (cookies, token): path -> ((mtime_ns, size), data)
+_json_file_cache: dict[Path, tuple[tuple[int, int], Any]] = {}
+
+
+def _read_json_cached(path: Path, default: dict | list) -> dict | list:
+    """Como _read_json, pero solo vuelve a parsear si cambió el mtime/tamaño del archivo (p. ej. otro proceso hizo login)."""
+    try:
+        st = path.stat()
+    except OSError:
+        _json_file_cache.pop(path, None)
+        return default
+    key = (st.st_mtime_ns, st.st_size)
+    hit = _json_file_cache.get(path)
+    if hit is not None and hit[0] == key:
+        return hit[1]
+    data = _read_json(path, default)
+    _json_file_cache[path] = (key, data)
+    return data
+
+
 def get_cookies() -> list[dict]:
-    return _read_json(COOKIES_FILE, [])
+    return list(_read_json_cached(COOKIES_FILE, []))
+
+
+_cookies_dict_cache: dict[str, Any] = {"src": None, "dict": {}}
+
+
+def get_cookies_dict() -> dict[str, str]:
+    """Cookies guardadas como {name: value} para httpx; se reconstruye solo cuando cambia cookies.json."""
+    raw = _read_json_cached(COOKIES_FILE, [])
+    if raw is not _cookies_dict_cache["src"]:
+        _cookies_dict_cache["dict"] = {
+            c["name"]: c["value"]
+            for c in raw
+            if isinstance(c, dict) and isinstance(c.get("name"), str) and isinstance(c.get("value"), str)
+        }
+        _cookies_dict_cache["src"] = raw
+    return _cookies_dict_cache["dict"]
 
 
 def save_cookies(cookies: list[dict]) -> None:
     COOKIES_FILE.parent.mkdir(parents=True, exist_ok=True)
     _write_json(COOKIES_FILE, cookies)
+    _json_file_cache.pop(COOKIES_FILE, None)
 
 
 def get_token() -> str | None:
     """Devuelve el token guardado (data.token del login) o None."""
-    data = _read_json(TOKEN_FILE, {})
+    data = _read_json_cached(TOKEN_FILE, {})
     if isinstance(data, dict):
         return data.get("token")
     return None
@@ -271,6 +378,7 @@ def save_token(token: str | None) -> None:
     TOKEN_FILE.parent.mkdir(parents=True, exist_ok=True)
     from datetime import datetime
     _write_json(TOKEN_FILE, {"token": token, "updated_at": datetime.utcnow().isoformat() + "Z"})
+    _json_file_cache.pop(TOKEN_FILE, None)
 
 
 # --- Pydantic models ---
@@ -345,7 +453,7 @@ def read_credentials():
 
 
 # WebSocket y cola para notificar progreso de login (credenciales)
-_credentials_ws_clients: list[WebSocket] = []
+_credentials_ws_clients: set[WebSocket] = set()
 _login_status_queue: queue.Queue = queue.Queue()
 
 
@@ -376,28 +484,54 @@ async def credentials_status_websocket(websocket: WebSocket):
     Mensajes: step, message y opcionalmente success, credentials.
     """
     await websocket.accept()
-    _credentials_ws_clients.append(websocket)
+    _credentials_ws_clients.add(websocket)
     try:
         while True:
             await asyncio.wait_for(websocket.receive_text(), timeout=300)
     except (WebSocketDisconnect, asyncio.TimeoutError):
         pass
     finally:
-        if websocket in _credentials_ws_clients:
-            _credentials_ws_clients.remove(websocket)
+        _credentials_ws_clients.discard(websocket)
 
 
-async def _broadcast_credentials_status(payload: dict) -> None:
-    """Envía un mensaje a todos los clientes del WebSocket de credenciales."""
-    dead: list[WebSocket] = []
-    for ws in list(_credentials_ws_clients):
+def _ws_message(payload: Any) -> str:
+    """Serializa un mensaje de WebSocket una sola vez (mismo formato compacto que send_json)."""
+    if orjson is not None:
+        return orjson.dumps(payload).decode()
+    return json.dumps(payload, separators=(",", ":"), ensure_ascii=False)
+
+
+_WS_PING = _ws_message({"type": "ping"})
+# Máximo que se espera un envío por cliente en los broadcasts: quien deja de leer no frena al resto
+_WS_SEND_TIMEOUT = 5.0
+
+
+async def _ws_broadcast(clients: set[WebSocket], payload: Any) -> None:
+    """
+    Envía payload a todos los clientes a la vez (uno lento no retrasa a los demás) y quita de
+    clients los que fallaron o no aceptaron el mensaje en _WS_SEND_TIMEOUT. El JSON se codifica una vez para todos.
+    """
+    targets = list(clients)
+    if not targets:
+        return
+    msg = _ws_message(payload)
+
+    async def safe_send(ws: WebSocket) -> bool:
         try:
-            await ws.send_json(payload)
+            await asyncio.wait_for(ws.send_text(msg), timeout=_WS_SEND_TIMEOUT)
+            return True
         except Exception:
-            dead.append(ws)
-    for ws in dead:
-        if ws in _credentials_ws_clients:
-            _credentials_ws_clients.remove(ws)
+            return False
+
+    results = await asyncio.gather(*(safe_send(ws) for ws in targets))
+    for ws, ok in zip(targets, results):
+        if not ok:
+            clients.discard(ws)
+
+
+async def _broadcast_credentials_status(payload: dict) -> None:
+    """Envía un mensaje a todos los clientes del WebSocket de credenciales."""
+    await _ws_broadcast(_credentials_ws_clients, payload)
 
 
 @app.post("/credentials/update-and-login")
@@ -462,10 +596,45 @@ def _value_for_select(cred_value: str) -> str:
     return f"string:{cred_value}"
 
 
+# Chromium se lanza una vez por hilo/proceso del executor de login y se reutiliza (Playwright sync no se comparte entre hilos).
+# Cada login usa un BrowserContext nuevo; el navegador termina con el proceso.
+_pw_local = threading.local()
+
+
+def _get_pw_browser():
+    """Navegador Chromium del hilo actual; lo (re)lanza si no existe o se desconectó."""
+    from playwright.sync_api import sync_playwright
+
+    browser = getattr(_pw_local, "browser", None)
+    if browser is not None and browser.is_connected():
+        return browser
+    if getattr(_pw_local, "pw", None) is None:
+        _pw_local.pw = sync_playwright().start()
+    browser = _pw_local.pw.chromium.launch(headless=True)
+    _pw_local.browser = browser
+    return browser
+
+
+@contextmanager
+def _pw_new_context():
+    """BrowserContext limpio sobre el navegador reutilizado; se cierra al salir (guarda el HAR si se estaba grabando)."""
+    context = _get_pw_browser().new_context(
+        user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+        ignore_https_errors=True,
+    )
+    try:
+        yield context
+    finally:
+        try:
+            context.close()
+        except Exception:
+            pass
+
+
 def _do_login_form_sync() -> dict:
     """Login rellenando el formulario de la página (como un usuario). Usa el HTML del login."""
     try:
-        from playwright.sync_api import sync_playwright
+        from playwright.sync_api import sync_playwright  # noqa: F401
     except ImportError:
         return {
             "_is_error": True,
@@ -479,15 +648,20 @@ def _do_login_form_sync() -> dict:
     logger.info("Login (form): inicio - usuario=%s", cred.get("usuario_nick", "?"))
 
     try:
-        with sync_playwright() as p:
-            browser = p.chromium.launch(headless=True)
-            context = browser.new_context(
-                user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-                ignore_https_errors=True,
-            )
+        with _pw_new_context() as context:
             saved_cookies = get_cookies()
             if saved_cookies:
                 context.add_cookies(saved_cookies)
+            if LOGIN_HAR_PATH:
+                # Estáticos del login (js/css/html/imágenes) desde HAR; las llamadas /m/rest/ y /api/ van siempre a la red.
+                # Si el HAR no existe se graba en esta corrida. Borrarlo cuando cambie la versión del sitio.
+                har_path = Path(LOGIN_HAR_PATH)
+                context.route_from_har(
+                    har_path,
+                    url=re.compile(r"^(?!.*/(?:m/rest|api)/).*$"),
+                    not_found="fallback",
+                    update=not har_path.exists(),
+                )
 
             page = context.new_page()
             page.goto(LOGIN_URL, wait_until="networkidle", timeout=30000)
@@ -502,7 +676,19 @@ def _do_login_form_sync() -> dict:
 
             # Orden: local (dispara carga de caja/turno), luego caja, turno, usuario, clave
             page.select_option('select[name="local_id"]', value=local_val)
-            page.wait_for_timeout(1500)  # fnCambiarLocal() carga cajas/turnos
+            # fnCambiarLocal() carga cajas/turnos: seguir en cuanto existan las opciones configuradas
+            # (no basta con que haya opciones: pueden ser las del estado inicial de la página)
+            try:
+                page.wait_for_function(
+                    """(wanted) => Object.entries(wanted).every(([n, v]) => {
+                        const s = document.querySelector(`select[name="${n}"]`);
+                        return !!s && Array.from(s.options).some(o => o.value === v);
+                    })""",
+                    arg={"caja_id": caja_val, "turno_id": turno_val},
+                    timeout=5000,
+                )
+            except Exception:
+                logger.warning("Login (form): cajas/turnos no cargaron a tiempo")
 
             try:
                 page.select_option('select[name="caja_id"]', value=caja_val)
@@ -525,13 +711,14 @@ def _do_login_form_sync() -> dict:
                 page.wait_for_selector('button[type="submit"]:not([disabled])', timeout=10000)
             except Exception as e:
                 logger.warning("Login (form): botón no se habilitó (caja/turno?): %s", e)
-            page.wait_for_timeout(500)
 
             # Esperar respuesta del login al hacer clic (Angular llama al API)
             login_resp_status = None
             token_from_form = None
             try:
-                with page.expect_response(lambda r: "usuario/login" in r.url) as resp_info:
+                with page.expect_response(
+                    lambda r: "usuario/login" in r.url and r.request.method == "POST"
+                ) as resp_info:
                     submit.click()
                     logger.info("Login (form): clic en Iniciar sesión")
                 resp = resp_info.value
@@ -549,8 +736,11 @@ def _do_login_form_sync() -> dict:
             except Exception as e:
                 logger.warning("Login (form): no se capturó respuesta del API: %s", e)
 
-            # Dar tiempo a redirección / actualización de la vista
-            page.wait_for_timeout(5000)
+            # Esperar la redirección fuera de #!/login (Playwright avisa en cuanto navega; sin sleep fijo)
+            try:
+                page.wait_for_url(lambda url: "#!/login" not in url, timeout=10000)
+            except Exception:
+                pass
             try:
                 page.wait_for_load_state("networkidle", timeout=8000)
             except Exception:
@@ -577,8 +767,6 @@ def _do_login_form_sync() -> dict:
                     except Exception:
                         pass
 
-            browser.close()
-
             # Éxito si ya no estamos en la ruta de login
             if "#!/login" in current_url:
                 msg = "El formulario se envió pero la página sigue en login (revisa usuario/clave o captcha)."
@@ -620,7 +808,7 @@ def _do_login_sync() -> dict:
     _login_status_push("start", "Iniciando login...")
     logger.info("Login: inicio")
     try:
-        from playwright.sync_api import sync_playwright
+        from playwright.sync_api import sync_playwright  # noqa: F401
     except ImportError as e:
         logger.error("Playwright no instalado: %s", e)
         _login_status_push("error", "Playwright no instalado.", success=False)
@@ -646,15 +834,9 @@ def _do_login_sync() -> dict:
     }
 
     try:
-        with sync_playwright() as p:
-            _login_status_push("browser_start", "Lanzando Chromium...")
-            logger.info("Login: lanzando Chromium")
-            browser = p.chromium.launch(headless=True)
-            context = browser.new_context(
-                user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-                ignore_https_errors=True,
-            )
-
+        _login_status_push("browser_start", "Lanzando Chromium...")
+        logger.info("Login: lanzando Chromium")
+        with _pw_new_context() as context:
             saved_cookies = get_cookies()
             if saved_cookies:
                 context.add_cookies(saved_cookies)
@@ -695,7 +877,6 @@ def _do_login_sync() -> dict:
             save_cookies(cookies)
             _login_status_push("saving_session", "Guardando sesión y cookies...")
             logger.info("Login: cookies guardadas (%s)", len(cookies))
-            browser.close()
 
     except Exception as e:
         logger.exception("Login: excepción en Playwright/request: %s", e)
@@ -843,15 +1024,23 @@ _LOGIN_REFRESH_INTERVAL_SECONDS = 12 * 3600  # 12 horas: hacer login de nuevo pa
 _login_executor: Any = None
 
 
+def _pw_worker_init() -> None:
+    """Initializer de cada worker de login: lanza Chromium una vez para que los logins siguientes lo reutilicen."""
+    try:
+        _get_pw_browser()
+    except Exception as e:
+        logger.warning("Login worker: no se pudo lanzar Chromium al iniciar (%s); se intentará en el login", e)
+
+
 def _get_executor():
     """En Windows usa ProcessPoolExecutor para evitar NotImplementedError de Playwright con subprocesos en threads."""
     global _login_executor
     if _login_executor is None:
         import concurrent.futures
         if sys.platform == "win32":
-            _login_executor = concurrent.futures.ProcessPoolExecutor(max_workers=2)
+            _login_executor = concurrent.futures.ProcessPoolExecutor(max_workers=2, initializer=_pw_worker_init)
         else:
-            _login_executor = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+            _login_executor = concurrent.futures.ThreadPoolExecutor(max_workers=2, initializer=_pw_worker_init)
     return _login_executor
 
 
@@ -874,14 +1063,22 @@ async def _login_refresh_loop() -> None:
 
 # --- Informe de ventas (Excel) ---
 
+_SANITIZE_PATH_TRANS = str.maketrans({c: "_" for c in '\\/:*?"<>|'})
+
+
 def _sanitize_path(name: str) -> str:
     """Nombre seguro para carpeta/archivo: sin caracteres inválidos."""
     if not name or not isinstance(name, str):
         return "sin_nombre"
-    s = name.strip()
-    for c in '\\/:*?"<>|':
-        s = s.replace(c, "_")
-    return s or "sin_nombre"
+    return name.strip().translate(_SANITIZE_PATH_TRANS) or "sin_nombre"
+
+
+# Formatos aceptados de Fecha: DD-MM-YYYY, YYYY-MM-DD, DD/MM/YYYY -> (regex, orden de grupos año/mes/día)
+_FECHA_PATTERNS = (
+    (re.compile(r"(\d{1,2})-(\d{1,2})-(\d{4})"), (3, 2, 1)),
+    (re.compile(r"(\d{4})-(\d{1,2})-(\d{1,2})"), (1, 2, 3)),
+    (re.compile(r"(\d{1,2})/(\d{1,2})/(\d{4})"), (3, 2, 1)),
+)
 
 
 def _parse_fecha_to_date_str(fecha: Any) -> str | None:
@@ -890,15 +1087,19 @@ def _parse_fecha_to_date_str(fecha: Any) -> str | None:
         return None
     if hasattr(fecha, "strftime"):
         return fecha.strftime("%Y-%m-%d")
-    s = str(fecha).strip()
+    s = str(fecha).strip()[:10]
     if not s:
         return None
-    # DD-MM-YYYY
-    for fmt in ("%d-%m-%Y", "%Y-%m-%d", "%d/%m/%Y"):
+    for pattern, (iy, im, iday) in _FECHA_PATTERNS:
+        m = pattern.fullmatch(s)
+        if not m:
+            continue
+        y, mo, d = int(m.group(iy)), int(m.group(im)), int(m.group(iday))
         try:
-            return datetime.strptime(s[:10], fmt).strftime("%Y-%m-%d")
+            datetime(y, mo, d)  # valida la fecha (ej. 31-02 no existe)
         except ValueError:
-            continue
+            return None
+        return f"{y:04d}-{mo:02d}-{d:02d}"
     return None
 
 
@@ -914,22 +1115,22 @@ _REPORT_JSON_COLUMNS = [
 ]
 
 
-def _excel_row_to_json_row(row_values: list, col_indices: dict) -> dict:
+def _excel_row_to_json_row(row_values: tuple | list, col_indices: dict) -> dict:
     out = {}
+    n = len(row_values)
     for key, idx in col_indices.items():
-        if idx is None:
+        val = row_values[idx] if idx is not None and idx < n else None
+        if val is None:
             out[key] = None
-            continue
-        val = row_values[idx] if idx < len(row_values) else None
-        if key == "Monto pagado" and isinstance(val, (int, float)):
+        elif key == "Monto pagado" and isinstance(val, (int, float)):
             out[key] = float(val)
-        elif val is not None and hasattr(val, "isoformat"):
+        elif hasattr(val, "isoformat"):
             try:
                 out[key] = val.isoformat()
             except Exception:
                 out[key] = str(val)
         else:
-            out[key] = str(val).strip() if val is not None and str(val).strip() else None
+            out[key] = str(val).strip() or None
     return out
 
 
@@ -937,48 +1138,64 @@ def _extract_ventas_json_from_excel(filepath: Path) -> list[dict]:
     """Lee el Excel y devuelve lista de dicts con las columnas indicadas, solo filas con fecha."""
     import openpyxl
     wb = openpyxl.load_workbook(filepath, read_only=True, data_only=True)
-    ws = wb.active
-    col_indices = {key: None for key, _ in _REPORT_JSON_COLUMNS}
-    header_found = False
-    out = []
+    try:
+        return _extract_ventas_rows(wb.active)
+    finally:
+        wb.close()
+
 
-    for row in ws.iter_rows(values_only=True):
-        row_list = list(row) if row else []
-        row_str = [str(c).strip() if c is not None else "" for c in row_list]
+def _extract_ventas_rows(ws: Any) -> list[dict]:
+    col_indices = {key: None for key, _ in _REPORT_JSON_COLUMNS}
+    header_row = None
 
-        if not header_found and ("Fecha" in row_str or "fecha" in row_str):
+    # Buscar la fila de cabecera (solo aquí se convierte cada celda a texto)
+    for n_row, row in enumerate(ws.iter_rows(values_only=True), start=1):
+        row_str = [str(c).strip() if c is not None else "" for c in row or ()]
+        if "Fecha" in row_str or "fecha" in row_str:
             for key, aliases in _REPORT_JSON_COLUMNS:
                 for alias in aliases:
                     if alias in row_str:
                         col_indices[key] = row_str.index(alias)
                         break
-            header_found = True
-            continue
-
-        if not header_found:
-            continue
+            header_row = n_row
+            break
 
-        idx_fecha = col_indices.get("Fecha")
-        if idx_fecha is None or idx_fecha >= len(row_list):
+    out = []
+    idx_fecha = col_indices.get("Fecha")
+    if header_row is None or idx_fecha is None:
+        return out
+    # Solo hasta la última columna usada: openpyxl (read_only) no construye el resto de celdas de cada fila
+    max_col = max(idx for idx in col_indices.values() if idx is not None) + 1
+    # Las filas de datos son tuplas (values_only): sin copia a list ni texto por celda
+    for row in ws.iter_rows(min_row=header_row + 1, max_col=max_col, values_only=True):
+        if not row or idx_fecha >= len(row):
             continue
-        fecha_val = row_list[idx_fecha]
-        if fecha_val is None or (isinstance(fecha_val, str) and not str(fecha_val).strip()):
+        fecha_val = row[idx_fecha]
+        if fecha_val is None or (isinstance(fecha_val, str) and not fecha_val.strip()):
             continue
-        item = _excel_row_to_json_row(row_list, col_indices)
+        item = _excel_row_to_json_row(row, col_indices)
         item["Fecha"] = fecha_val.isoformat() if hasattr(fecha_val, "isoformat") else str(fecha_val).strip()
         out.append(item)
-
-    wb.close()
     return out
 
 
+def _process_report_excel(filepath: Path) -> list[dict]:
+    """Extrae las filas del Excel, las guarda por local/día/canal y como JSON plano junto al Excel (mismo nombre)."""
+    filas = _extract_ventas_json_from_excel(filepath)
+    _save_filas_by_local_day_canal(filas)
+    _write_json(filepath.with_suffix(".json"), filas)
+    return filas
+
+
 def _save_filas_by_local_day_canal(filas: list[dict]) -> None:
     """
     Guarda las filas en estructura: reports/{Local}/{YYYY-MM-DD}/{Canal delivery}.json
     y actualiza locales.json y canales_delivery.json (listas sin repetir).
     """
-    from collections import defaultdict
-    groups = defaultdict(list)
+    from itertools import groupby
+    from operator import itemgetter
+
+    keyed: list[tuple[tuple[str, str, str], dict]] = []
     locales_set = set()
     canales_set = set()
 
@@ -989,29 +1206,35 @@ def _save_filas_by_local_day_canal(filas: list[dict]) -> None:
         if not date_str:
             continue
         canal = (row.get("Canal de delivery") or "").strip() or "Sin canal"
-        key = (local, date_str, canal)
-        groups[key].append(row)
+        # Clave = ruta del archivo (nombres ya saneados), así nombres que sanean igual van al mismo archivo
+        keyed.append(((_sanitize_path(local), date_str, _sanitize_path(canal)), row))
         locales_set.add(local)
         canales_set.add(canal)
 
     REPORTS_DIR.mkdir(parents=True, exist_ok=True)
 
-    for (local, date_str, canal), rows in groups.items():
-        dir_local = REPORTS_DIR / _sanitize_path(local) / date_str
-        dir_local.mkdir(parents=True, exist_ok=True)
-        filepath = dir_local / f"{_sanitize_path(canal)}.json"
-        _write_json(filepath, rows)
-        logger.info("Report: guardado %s (%s filas)", filepath, len(rows))
+    # Orden estable por clave y groupby: grupos contiguos sin buckets intermedios; carpetas una vez por local/fecha
+    keyed.sort(key=itemgetter(0))
+    writes: list[tuple[Path, list[dict]]] = []
+    dir_key = None
+    for (local_dir, date_str, canal_file), group in groupby(keyed, key=itemgetter(0)):
+        if dir_key != (local_dir, date_str):
+            dir_key = (local_dir, date_str)
+            dir_local = REPORTS_DIR / local_dir / date_str
+            dir_local.mkdir(parents=True, exist_ok=True)
+        writes.append((dir_local / f"{canal_file}.json", [row for _, row in group]))
+    if writes:
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=min(8, len(writes))) as pool:
+            list(pool.map(lambda w: _write_json(*w), writes))
+        for filepath, rows in writes:
+            logger.info("Report: guardado %s (%s filas)", filepath, len(rows))
 
     # Actualizar índices: canales sin repetir; locales se fusionan (mantener id+name desde API)
     existing_locales = _locales_list_for_iteration()
-    existing_names = {_locale_name(x) for x in existing_locales if _locale_name(x)}
-    existing_dicts = []
-    for x in existing_locales:
-        if isinstance(x, dict) and x.get("name"):
-            existing_dicts.append(x)
-        elif isinstance(x, str) and x.strip():
-            existing_dicts.append({"id": "", "name": x.strip()})
+    existing_dicts = [x for x in existing_locales if x["name"]]
+    existing_names = {x["name"] for x in existing_dicts}
     for name in locales_set:
         if name and name not in existing_names:
             existing_dicts.append({"id": "", "name": name})
@@ -1049,6 +1272,13 @@ _REPORT_DEFAULT_PARAMS = {
     "ruc": "-1",
     "idmonedatc": "-1",
 }
+# Parte fija de la URL del reporte, codificada una vez: por petición solo se codifican name, f1, f2 y token
+_REPORT_URL_BASE = f"{REPORT_URL}?{urlencode(_REPORT_DEFAULT_PARAMS)}"
+
+
+def _report_url(report_name: str, f1: str, f2: str, token: str) -> str:
+    """URL del informe de ventas: parámetros fijos precodificados + los de esta descarga."""
+    return f"{_REPORT_URL_BASE}&{urlencode({'name': report_name, 'f1': f1, 'f2': f2, 'token': token})}"
 
 # Zona horaria Colombia para "hoy" (en Windows puede requerir pip install tzdata)
 _COLOMBIA_TZ = None
@@ -1075,9 +1305,18 @@ def _now_colombia_str() -> str:
     return now.strftime("%Y-%m-%d %H:%M:%S") + " (UTC)"
 
 
+_today_cache: dict[str, Any] = {"date": None, "valid_until": 0.0}  # fecha de hoy y timestamp de la próxima medianoche
+
+
 def _get_today_colombia() -> str:
-    """Fecha de hoy en Colombia (solo año-mes-día, sin hora)."""
-    return _now().strftime("%Y-%m-%d")
+    """Fecha de hoy en Colombia (solo año-mes-día, sin hora). Se recalcula solo al pasar la medianoche."""
+    if time.time() < _today_cache["valid_until"]:
+        return _today_cache["date"]
+    now = _now()
+    midnight = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    _today_cache["date"] = now.strftime("%Y-%m-%d")
+    _today_cache["valid_until"] = time.time() + (midnight - now).total_seconds()
+    return _today_cache["date"]
 
 
 def _parse_hhmm(s: str) -> tuple[int, int]:
@@ -1092,35 +1331,100 @@ def _parse_hhmm(s: str) -> tuple[int, int]:
     return 0, 0
 
 
+# Ventana de apertura ya en minutos: (clave mtime/size de horarios.json, open_min, close_min, cruza medianoche)
+_horario_cache: dict[str, Any] = {"key": None, "window": None}
+
+
+def _opening_window() -> tuple[int, int, bool]:
+    """
+    (open_minutes, close_minutes, wraps_midnight) de horarios.json; solo se relee y parsea si el archivo cambia.
+    Por defecto: 12:30 a 00:00 (medianoche).
+    """
+    key = _file_stat_key(HORARIOS_JSON)
+    if key is not None and key == _horario_cache["key"]:
+        return _horario_cache["window"]
+    data = _read_json(HORARIOS_JSON, {}) if key is not None else {}
+    if not isinstance(data, dict):
+        window = (0, 24 * 60, False)  # formato inválido: siempre abierto
+    else:
+        open_h, open_m = _parse_hhmm((data.get("open_at") or "12:30").strip())
+        close_h, close_m = _parse_hhmm((data.get("close_at") or "00:00").strip())
+        open_minutes = open_h * 60 + open_m
+        close_minutes = close_h * 60 + close_m
+        # Cierra a medianoche o después (ej. open 12:30, close 00:00): la ventana cruza el día
+        window = (open_minutes, close_minutes, close_minutes <= open_minutes)
+    _horario_cache["key"] = key
+    _horario_cache["window"] = window
+    return window
+
+
 def _is_within_opening_hours() -> bool:
     """
     True si la hora actual en Colombia está dentro del horario de apertura (horarios.json).
     Por defecto: 12:30 a 00:00 (medianoche). Fuera de ese horario el restaurante está cerrado.
     """
-    data = _read_json(HORARIOS_JSON, {})
-    if not isinstance(data, dict):
-        return True
-    open_at = (data.get("open_at") or "12:30").strip()
-    close_at = (data.get("close_at") or "00:00").strip()
+    open_minutes, close_minutes, wraps = _opening_window()
     now = _now()
-    h, m = now.hour, now.minute
-    open_h, open_m = _parse_hhmm(open_at)
-    close_h, close_m = _parse_hhmm(close_at)
-    now_minutes = h * 60 + m
-    open_minutes = open_h * 60 + open_m
-    close_minutes = close_h * 60 + close_m
-    if close_minutes <= open_minutes:
-        # Cierra a medianoche (ej. open 12:30, close 00:00): abierto si now >= open o now < close
-        return now_minutes >= open_minutes or now_minutes < close_minutes
+    now_minutes = now.hour * 60 + now.minute
+    if wraps:
+        # Abierto si now >= open o now < close
+        return (now_minutes >= open_minutes) or (now_minutes < close_minutes)
     return open_minutes <= now_minutes < close_minutes
 
 
+_HTML_SNIFF_BYTES = 20
+
+
+def _looks_like_html(head: bytes) -> bool:
+    """True si los primeros bytes del cuerpo son una página HTML (error o login) en lugar del Excel."""
+    head = head.lstrip()[:_HTML_SNIFF_BYTES].lower()
+    return head.startswith(b"<!doctype") or head.startswith(b"<html")
+
+
+async def _download_report(url: str, cookies_dict: dict[str, str], filepath: Path) -> tuple[int, bool, int]:
+    """
+    Descarga el Excel del reporte en streaming directo a filepath (sin tener todo el archivo en memoria).
+    Retorna (status_code, is_html, bytes). Si no es 200 o el servidor devolvió HTML no se toca filepath.
+    """
+    # Nombre único por tarea: dos /report simultáneos del mismo rango no escriben en el mismo .part
+    part = filepath.with_name(f"{filepath.name}.{os.getpid()}.{id(asyncio.current_task())}.part")
+    size = 0
+    async with _get_http_client().stream("GET", url, cookies=cookies_dict, follow_redirects=True) as resp:
+        if resp.status_code != 200:
+            return resp.status_code, False, 0
+        if "html" in (resp.headers.get("content-type") or "").lower():
+            return resp.status_code, True, 0
+        try:
+            with part.open("wb") as f:
+                # Se retienen solo los primeros bytes hasta poder decidir si es una página HTML de error
+                head = b""
+                async for chunk in resp.aiter_bytes(1 << 16):
+                    if head is not None:
+                        head += chunk
+                        if len(head.lstrip()) < _HTML_SNIFF_BYTES:
+                            continue
+                        if _looks_like_html(head):
+                            return resp.status_code, True, 0
+                        chunk, head = head, None
+                    f.write(chunk)
+                    size += len(chunk)
+                if head:
+                    # Cuerpo más corto que _HTML_SNIFF_BYTES
+                    if _looks_like_html(head):
+                        return resp.status_code, True, 0
+                    f.write(head)
+                    size += len(head)
+            os.replace(part, filepath)
+        finally:
+            part.unlink(missing_ok=True)
+    return resp.status_code, False, size
+
+
 async def _run_report_for_date(fecha: str) -> dict:
     """
     Descarga el reporte para una fecha (YYYY-MM-DD), guarda Excel y JSON por local/día/canal.
     Retorna {"success": bool, "error": str|None, "filas": int}.
     """
-    import httpx
     token = get_token()
     if not token:
         return {"success": False, "error": "No hay token. Haz login (POST /login).", "filas": 0}
@@ -1128,30 +1432,22 @@ async def _run_report_for_date(fecha: str) -> dict:
     f2 = f"{fecha} 23:59:59"
     name_suffix = datetime.utcnow().strftime("%d.%m.%Y_%H.%M.%S")
     report_name = f"InformeVentas_{name_suffix}"
-    params = {**_REPORT_DEFAULT_PARAMS, "name": report_name, "f1": f1, "f2": f2, "token": token}
-    url = f"{REPORT_URL}?{urlencode(params)}"
+    url = _report_url(report_name, f1, f2, token)
     REPORTS_DIR.mkdir(parents=True, exist_ok=True)
-    cookies_dict = {c["name"]: c["value"] for c in get_cookies() if isinstance(c.get("name"), str) and isinstance(c.get("value"), str)}
+    cookies_dict = get_cookies_dict()
+    filename = f"InformeVentas_{fecha}_{fecha}.xlsx"
+    filepath = REPORTS_DIR / filename
     try:
-        async with httpx.AsyncClient(timeout=60.0, follow_redirects=True) as client:
-            resp = await client.get(url, cookies=cookies_dict)
+        status_code, is_html, _ = await _download_report(url, cookies_dict, filepath)
     except Exception as e:
         return {"success": False, "error": str(e), "filas": 0}
-    if resp.status_code != 200:
-        return {"success": False, "error": f"HTTP {resp.status_code}", "filas": 0}
-    ct = (resp.headers.get("content-type") or "").lower()
-    is_html = "html" in ct or (len(resp.content) < 2000 and resp.content.strip()[:20].lower().startswith(b"<!doctype"))
+    if status_code != 200:
+        return {"success": False, "error": f"HTTP {status_code}", "filas": 0}
     if is_html:
         return {"success": False, "error": "Servidor devolvió HTML (token/sesión inválidos).", "filas": 0}
-    filename = f"InformeVentas_{fecha}_{fecha}.xlsx"
-    filepath = REPORTS_DIR / filename
-    filepath.write_bytes(resp.content)
     filas = []
     try:
-        filas = _extract_ventas_json_from_excel(filepath)
-        _save_filas_by_local_day_canal(filas)
-        json_flat = REPORTS_DIR / filename.replace(".xlsx", ".json")
-        _write_json(json_flat, filas)
+        filas = await asyncio.to_thread(_process_report_excel, filepath)
     except Exception as e:
         logger.warning("Report automático: no se pudo generar JSON: %s", e)
     return {"success": True, "error": None, "filas": len(filas)}
@@ -1166,7 +1462,7 @@ _report_scheduler_state: dict[str, Any] = {
     "last_filas": 0,
     "interval_seconds": 300,  # 5 min
 }
-_report_ws_clients: list[WebSocket] = []
+_report_ws_clients: set[WebSocket] = set()
 
 
 async def _report_scheduler_loop() -> None:
@@ -1176,10 +1472,10 @@ async def _report_scheduler_loop() -> None:
         now = _now()
         if state["next_run_at"] is None:
             state["next_run_at"] = now
-        target = state["next_run_at"]
-        if now < target:
-            await asyncio.sleep(1)
-            continue
+        # Un solo sleep hasta la próxima consulta; tope en el intervalo por si el reloj salta
+        delay = min((state["next_run_at"] - now).total_seconds(), state["interval_seconds"])
+        if delay > 0:
+            await asyncio.sleep(delay)
         fecha = _get_today_colombia()
         state["status"] = "calling_report"
         state["last_error"] = None
@@ -1196,7 +1492,6 @@ async def _report_scheduler_loop() -> None:
             state["last_error"] = result.get("error") or "Error desconocido"
             logger.warning("Report automático: falló - %s", state["last_error"])
         state["next_run_at"] = state["last_report_at"].replace(microsecond=0) + timedelta(seconds=state["interval_seconds"])
-        await asyncio.sleep(1)
 
 
 # --- Locales desde API (actualización cada 10 min) ---
@@ -1209,7 +1504,6 @@ async def _fetch_and_save_locales() -> bool:
     POST a getLocalesPermitidos/0 con Token token="...", parsea data[] y guarda
     en reports/locales.json como [{"id": local_id, "name": local_descripcion}, ...].
     """
-    import httpx
     token = get_token()
     if not token:
         logger.debug("Locales API: no hay token, se omite actualización")
@@ -1217,12 +1511,12 @@ async def _fetch_and_save_locales() -> bool:
     auth_header = f'Token token="{token}"'
     REPORTS_LOCALES_JSON.parent.mkdir(parents=True, exist_ok=True)
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            resp = await client.post(
-                LOCALES_API_URL,
-                headers={"Authorization": auth_header},
-                json={},
-            )
+        resp = await _get_http_client().post(
+            LOCALES_API_URL,
+            headers={"Authorization": auth_header},
+            json={},
+            timeout=30.0,
+        )
     except Exception as e:
         logger.warning("Locales API: error de conexión - %s", e)
         return False
@@ -1230,7 +1524,7 @@ async def _fetch_and_save_locales() -> bool:
         logger.warning("Locales API: HTTP %s", resp.status_code)
         return False
     try:
-        body = resp.json()
+        body = _json_loads(resp.content)
     except Exception:
         logger.warning("Locales API: respuesta no es JSON")
         return False
@@ -1251,6 +1545,10 @@ async def _fetch_and_save_locales() -> bool:
             continue
         items.append({"id": local_id, "name": local_descripcion})
     items.sort(key=lambda x: (x["name"].lower(), x["id"]))
+    if items == _read_json(REPORTS_LOCALES_JSON, []):
+        # Sin cambios: no reescribir, así la cache de locales (por mtime) sigue válida
+        logger.debug("Locales API: sin cambios (%s locales)", len(items))
+        return True
     _write_json(REPORTS_LOCALES_JSON, items)
     logger.info("Locales API: actualizados %s locales", len(items))
     return True
@@ -1264,7 +1562,7 @@ async def _locales_scheduler_loop() -> None:
 
 
 _DELIVERYS_INTERVAL_SECONDS = 120  # consulta API cada 2 minutos
-_DELIVERYS_DELAY_BETWEEN_LOCALS = 5  # segundos entre cada sede para no saturar la API
+_DELIVERYS_CONCURRENCY = 4  # sedes consultadas a la vez (límite para no saturar la API)
 _DELIVERYS_MAX_PER_LOCAL = 100  # solo los primeros 100 resultados por sede
 
 # Estado compartido para el scheduler de deliverys y el WebSocket /report/ws
@@ -1278,88 +1576,84 @@ _deliverys_scheduler_state: dict[str, Any] = {
 }
 
 
+async def _broadcast_sede_ready(date_str: str) -> None:
+    """Avisa por /report/ws que recargue pedidos de cada sede del restaurant_map del día."""
+    restaurant_map_path = REPORTS_RESTAURANT_MAPS_DIR / f"restaurant_map_{date_str}.json"
+    if not restaurant_map_path.exists():
+        return
+    by_local = _read_json(restaurant_map_path, {})
+    if not isinstance(by_local, dict):
+        return
+    for local_id in by_local.keys():
+        await _ws_broadcast(_report_ws_clients, {"type": "sede_ready", "local_id": local_id, "fecha": date_str})
+
+
 async def _on_didi_map_updated(date_str: str) -> None:
     """Se llama cuando se actualiza didi_restaurant_map (p. ej. extensión envía daily-orders). Hace merge y notifica."""
     try:
-        _build_restaurant_map_for_date(date_str)
-        _cross_didi_map_and_update_orders(date_str)
-        restaurant_map_path = REPORTS_RESTAURANT_MAPS_DIR / f"restaurant_map_{date_str}.json"
-        if restaurant_map_path.exists():
-            by_local = _read_json(restaurant_map_path, {})
-            if isinstance(by_local, dict):
-                for local_id in by_local.keys():
-                    payload = {"type": "sede_ready", "local_id": local_id, "fecha": date_str}
-                    for ws in list(_report_ws_clients):
-                        try:
-                            await ws.send_json(payload)
-                        except Exception:
-                            pass
+        await asyncio.to_thread(_build_restaurant_map_for_date, date_str)
+        await asyncio.to_thread(_cross_didi_map_and_update_orders, date_str)
+        await _broadcast_sede_ready(date_str)
     except Exception as e:
         logger.debug("Merge al actualizar mapa Didi: %s", e)
 
 
 async def _deliverys_scheduler_loop() -> None:
-    """Cada 2 minutos consulta obtenerDeliverysPorLocalSimple para cada local_id (fecha hoy); espera 5 s entre sedes."""
-    import httpx
+    """Cada 2 minutos consulta obtenerDeliverysPorLocalSimple para cada local_id (fecha hoy); varias sedes en paralelo."""
     state = _deliverys_scheduler_state
     while True:
-        await asyncio.sleep(1)
         now = _now()
         if state["next_run_at"] is None:
             state["next_run_at"] = now
-        if now < state["next_run_at"]:
-            continue
+        # Un solo sleep hasta la próxima consulta; tope en el intervalo por si el reloj salta
+        delay = min((state["next_run_at"] - now).total_seconds(), _DELIVERYS_INTERVAL_SECONDS)
+        if delay > 0:
+            await asyncio.sleep(delay)
+            now = _now()
         locales_data = _locales_list_for_iteration()
         local_ids = []
         for item in locales_data:
-            lid = _locale_id(item) if isinstance(item, dict) else ""
+            lid = _locale_id(item)
             if lid:
                 local_ids.append(lid)
         if not local_ids:
             state["next_run_at"] = now.replace(microsecond=0) + timedelta(seconds=_DELIVERYS_INTERVAL_SECONDS)
-            await asyncio.sleep(1)
             continue
         if not _is_within_opening_hours():
             logger.debug("Deliverys scheduler: fuera de horario de apertura (restaurante cerrado), se omite")
             state["next_run_at"] = now.replace(microsecond=0) + timedelta(seconds=_DELIVERYS_INTERVAL_SECONDS)
-            await asyncio.sleep(1)
             continue
         token = get_token()
-        cookies_dict = {c["name"]: c["value"] for c in get_cookies() if isinstance(c.get("name"), str) and isinstance(c.get("value"), str)}
+        cookies_dict = get_cookies_dict()
         if not token:
             logger.debug("Deliverys scheduler: sin token, se omite (haz login)")
             state["next_run_at"] = now.replace(microsecond=0) + timedelta(seconds=_DELIVERYS_INTERVAL_SECONDS)
-            await asyncio.sleep(1)
             continue
         state["status"] = "calling_deliverys"
         state["last_error"] = None
         logger.info("Deliverys scheduler: consultando %s locales (fecha hoy)", len(local_ids))
         total_filas = 0
         try:
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                fecha_hoy = _get_today_colombia()
-                for i, local_id in enumerate(local_ids):
+            client = _get_http_client()
+            fecha_hoy = _get_today_colombia()
+            sem = asyncio.Semaphore(_DELIVERYS_CONCURRENCY)
+            canales_seen: set[str] = set()
+
+            async def _one(local_id: str) -> int:
+                async with sem:
                     data = await _fetch_deliverys_for_local(client, local_id, cookies_dict, token)
-                    _save_deliverys_for_local(local_id, data, consultation_date=fecha_hoy)
-                    total_filas += len(data)
-                    if i < len(local_ids) - 1:
-                        await asyncio.sleep(_DELIVERYS_DELAY_BETWEEN_LOCALS)
-            _update_canales_from_deliverys_cache()
+                await asyncio.to_thread(_save_deliverys_for_local, local_id, data, fecha_hoy)
+                canales_seen.update(_delivery_canal_desc(r) for r in data if isinstance(r, dict))
+                return len(data)
+
+            total_filas = sum(await asyncio.gather(*(_one(lid) for lid in local_ids)))
+            canales_seen.discard("")
             fecha_hoy = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-            _build_restaurant_map_for_date(fecha_hoy)
-            _cross_didi_map_and_update_orders(fecha_hoy)
+            await asyncio.to_thread(_update_canales_from_deliverys_cache, canales_seen)
+            await asyncio.to_thread(_build_restaurant_map_for_date, fecha_hoy)
+            await asyncio.to_thread(_cross_didi_map_and_update_orders, fecha_hoy)
             # Notificar a frontend que recargue pedidos (ya con ids Didi reemplazados) para cada sede del día
-            restaurant_map_path = REPORTS_RESTAURANT_MAPS_DIR / f"restaurant_map_{fecha_hoy}.json"
-            if restaurant_map_path.exists():
-                by_local = _read_json(restaurant_map_path, {})
-                if isinstance(by_local, dict):
-                    for local_id in by_local.keys():
-                        payload = {"type": "sede_ready", "local_id": local_id, "fecha": fecha_hoy}
-                        for ws in list(_report_ws_clients):
-                            try:
-                                await ws.send_json(payload)
-                            except Exception:
-                                pass
+            await _broadcast_sede_ready(fecha_hoy)
             state["status"] = "deliverys_ready"
             state["last_error"] = None
             state["last_filas"] = total_filas
@@ -1370,33 +1664,64 @@ async def _deliverys_scheduler_loop() -> None:
             logger.warning("Deliverys scheduler: error - %s", e)
         state["last_report_at"] = _now()
         state["next_run_at"] = state["last_report_at"].replace(microsecond=0) + timedelta(seconds=_DELIVERYS_INTERVAL_SECONDS)
-        await asyncio.sleep(1)
 
 
-def _locales_list_for_iteration() -> list[dict[str, str] | str]:
-    """Devuelve la lista de locales filtrada por blacklist y con renombres aplicados."""
+# Locales ya filtrados/renombrados (siempre {"id", "name"}) + índices nombre -> local_id y local_id -> nombre;
+# se reconstruye solo si cambian locales.json o locales_config.json
+_locales_cache: dict[str, Any] = {"key": None, "list": [], "id_by_name": {}, "name_by_id": {}}
+
+
+def _file_stat_key(path: Path) -> tuple[int, int] | None:
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def _locales_cached() -> dict[str, Any]:
+    key = (_file_stat_key(REPORTS_LOCALES_JSON), _file_stat_key(LOCALES_CONFIG_JSON))
+    if _locales_cache["key"] == key:
+        return _locales_cache
     data = _read_json(REPORTS_LOCALES_JSON, [])
-    if not isinstance(data, list):
-        return []
-    cfg = _read_json(LOCALES_CONFIG_JSON, {})
-    blacklist: set[str] = {str(x) for x in (cfg.get("blacklist_ids") or [])}
-    rename: dict[str, str] = {str(k): v for k, v in (cfg.get("rename") or {}).items()}
     result = []
-    for item in data:
-        lid = str(item.get("id", "")) if isinstance(item, dict) else ""
-        if lid and lid in blacklist:
-            continue
-        if lid and lid in rename and isinstance(item, dict):
-            item = {**item, "name": rename[lid]}
-        result.append(item)
-    return result
+    id_by_name: dict[str, str | None] = {}
+    name_by_id: dict[str, str] = {}
+    if isinstance(data, list):
+        cfg = _read_json(LOCALES_CONFIG_JSON, {})
+        blacklist: set[str] = {str(x) for x in (cfg.get("blacklist_ids") or [])}
+        rename: dict[str, str] = {str(k): v for k, v in (cfg.get("rename") or {}).items()}
+        for item in data:
+            # Normalizar una sola vez: los ítems legacy (solo nombre) pasan a {"id": "", "name": ...}
+            if isinstance(item, dict):
+                item = {**item, "id": str(item.get("id") or "").strip(), "name": (item.get("name") or "").strip()}
+            elif isinstance(item, str):
+                item = {"id": "", "name": item.strip()}
+            else:
+                continue
+            lid = item["id"]
+            if lid:
+                # Nombre tal como viene en locales.json (antes de blacklist/renombres)
+                name_by_id.setdefault(lid, item["name"])
+            if lid and lid in blacklist:
+                continue
+            if lid and lid in rename:
+                item["name"] = rename[lid]
+            result.append(item)
+            # Igual que la búsqueda lineal: gana el primer local con ese nombre
+            id_by_name.setdefault(item["name"], lid or None)
+    _locales_cache.update(key=key, list=result, id_by_name=id_by_name, name_by_id=name_by_id)
+    return _locales_cache
 
 
-def _locale_name(item: dict[str, str] | str) -> str:
-    """Extrae el nombre del local de un ítem (dict con 'name' o string legacy)."""
-    if isinstance(item, dict):
-        return (item.get("name") or "").strip()
-    return (item or "").strip()
+def _locales_list_for_iteration() -> list[dict[str, str]]:
+    """Devuelve la lista de locales filtrada por blacklist y con renombres aplicados."""
+    return list(_locales_cached()["list"])
+
+
+def _locale_name(item: dict[str, str]) -> str:
+    """Nombre del local de un ítem de _locales_list_for_iteration."""
+    return item["name"]
 
 
 @app.get("/report")
@@ -1408,8 +1733,6 @@ async def report_ventas(
     Descarga el informe de ventas en Excel para el rango de fechas.
     Usa el token y las cookies guardadas. Guarda el archivo en la carpeta reports/ y lo devuelve.
     """
-    import httpx
-
     token = get_token()
     if not token:
         raise HTTPException(status_code=401, detail="No hay token. Haz login primero (POST /login).")
@@ -1426,30 +1749,28 @@ async def report_ventas(
     name_suffix = datetime.utcnow().strftime("%d.%m.%Y_%H.%M.%S")
     report_name = f"InformeVentas_{name_suffix}"
 
-    params = {**_REPORT_DEFAULT_PARAMS, "name": report_name, "f1": f1, "f2": f2, "token": token}
-    url = f"{REPORT_URL}?{urlencode(params)}"
+    url = _report_url(report_name, f1, f2, token)
 
     REPORTS_DIR.mkdir(parents=True, exist_ok=True)
 
-    cookies_list = get_cookies()
-    cookies_dict = {c["name"]: c["value"] for c in cookies_list if isinstance(c.get("name"), str) and isinstance(c.get("value"), str)}
+    cookies_dict = get_cookies_dict()
+
+    filename = f"InformeVentas_{fecha_inicio}_{fecha_fin}.xlsx"
+    filepath = REPORTS_DIR / filename
 
     try:
-        async with httpx.AsyncClient(timeout=60.0, follow_redirects=True) as client:
-            resp = await client.get(url, cookies=cookies_dict)
+        status_code, is_html, size = await _download_report(url, cookies_dict, filepath)
     except Exception as e:
         logger.exception("Report: error de conexión %s", e)
         raise HTTPException(status_code=502, detail=f"Error al conectar con el servidor del reporte: {e}")
 
-    if resp.status_code != 200:
-        logger.warning("Report: respuesta %s", resp.status_code)
+    if status_code != 200:
+        logger.warning("Report: respuesta %s", status_code)
         raise HTTPException(
             status_code=502,
-            detail=f"El servidor del reporte respondió {resp.status_code}. ¿Token o sesión expirados? Haz login de nuevo.",
+            detail=f"El servidor del reporte respondió {status_code}. ¿Token o sesión expirados? Haz login de nuevo.",
         )
 
-    content_type = (resp.headers.get("content-type") or "").lower()
-    is_html = "html" in content_type or (len(resp.content) < 2000 and resp.content.strip()[:20].lower().startswith(b"<!doctype")) or resp.content.strip()[:10].lower().startswith(b"<html")
     if is_html:
         logger.warning("Report: respuesta HTML (posible error o login requerido)")
         raise HTTPException(
@@ -1457,19 +1778,12 @@ async def report_ventas(
             detail="El servidor devolvió HTML en lugar de Excel (token/sesión inválidos o error del servidor).",
         )
 
-    filename = f"InformeVentas_{fecha_inicio}_{fecha_fin}.xlsx"
-    filepath = REPORTS_DIR / filename
-    filepath.write_bytes(resp.content)
-    logger.info("Report: guardado %s (%s bytes)", filepath, len(resp.content))
+    logger.info("Report: guardado %s (%s bytes)", filepath, size)
 
-    # Extraer y guardar por carpeta: Local -> día -> archivo por canal delivery + índices
+    # Extraer y guardar por carpeta: Local -> día -> archivo por canal delivery + índices (fuera del event loop)
     try:
-        filas = _extract_ventas_json_from_excel(filepath)
-        _save_filas_by_local_day_canal(filas)
-        # También guardar el JSON plano por compatibilidad (mismo nombre que el Excel)
-        json_flat = REPORTS_DIR / filename.replace(".xlsx", ".json")
-        _write_json(json_flat, filas)
-        logger.info("Report: guardado %s (%s filas)", json_flat, len(filas))
+        filas = await asyncio.to_thread(_process_report_excel, filepath)
+        logger.info("Report: guardado %s (%s filas)", filepath.with_suffix(".json"), len(filas))
     except Exception as e:
         logger.warning("Report: no se pudo generar JSON del Excel: %s", e)
 
@@ -1497,60 +1811,64 @@ def get_report_canales_delivery():
 
 # --- Órdenes y fotos (frontend) ---
 
+# Igual que str.isalnum() o "._-": \w en Unicode acepta las mismas letras/dígitos (y "_", que se deja igual)
+_CODIGO_UNSAFE_RE = re.compile(r"[^\w.-]")
+
+
+@lru_cache(maxsize=4096)
 def _sanitize_codigo(codigo: str) -> str:
     """Código seguro para rutas de archivo."""
-    s = (codigo or "").strip()
-    return "".join(c if c.isalnum() or c in "._-" else "_" for c in s) or "sin_codigo"
+    return _CODIGO_UNSAFE_RE.sub("_", (codigo or "").strip()) or "sin_codigo"
 
 
 # --- Deliverys API (órdenes por local, cada 5 min; reemplaza Excel para listado) ---
 
 
+_PRIVACY_RE = re.compile(r"privacy\s+protection\s*", re.IGNORECASE)
+_STARS_RE = re.compile(r"\*+")
+
+
 def _clean_privacy_name(s: str) -> str:
     """Quita 'privacy protection' y asteriscos de nombres. Deja solo la parte visible."""
     if not s or not isinstance(s, str):
         return ""
-    s = s.strip()
-    s = re.sub(r"privacy\s+protection\s*", "", s, flags=re.IGNORECASE)
-    s = re.sub(r"\*+", "", s)
-    return " ".join(s.split()).strip()
+    return " ".join(_STARS_RE.sub("", _PRIVACY_RE.sub("", s)).split())
+
+
+def _row_codigo_integracion(row: dict) -> str:
+    """'Codigo integracion' de una fila de deliverys (displayNum Didi sin #); "—" si no tiene."""
+    cod = (row.get("delivery_codigolimadelivery") or row.get("delivery_codigointegracion") or "").strip()
+    return _normalize_didi_display_num(cod) or cod or "—"
 
 
 def _delivery_row_to_order(row: dict) -> dict:
     """Convierte un ítem de la API obtenerDeliverysPorLocalSimple al formato orden (frontend)."""
-    nombres = _clean_privacy_name((row.get("delivery_nombres") or "").strip())
-    apellidos = _clean_privacy_name((row.get("delivery_apellidos") or "").strip())
+    g = row.get
+    nombres = _clean_privacy_name(g("delivery_nombres") or "")
+    apellidos = _clean_privacy_name(g("delivery_apellidos") or "")
     if apellidos and apellidos != ".":
         cliente = f"{nombres} {apellidos}".strip()
     else:
         cliente = nombres or "—"
-    canal_obj = row.get("canaldelivery") or {}
-    canal = (canal_obj.get("canaldelivery_descripcion") or row.get("canaldelivery_descripcion") or "").strip() or "—"
-    fecha_hora = (row.get("delivery_fecha") or "").strip()
-    fecha = fecha_hora[:10] if len(fecha_hora) >= 10 else ""
-    hora = fecha_hora[11:19] if len(fecha_hora) >= 19 else (fecha_hora[11:] if len(fecha_hora) > 10 else "")
-    importe = (row.get("delivery_importe") or "").strip()
-    try:
-        monto_val = float(importe) if importe else None
-    except (ValueError, TypeError):
-        monto_val = None
-    codigo_integracion = (
-        (row.get("delivery_codigolimadelivery") or row.get("delivery_codigointegracion") or "").strip()
-    ) or "—"
-    codigo_integracion = _normalize_didi_display_num(codigo_integracion) or codigo_integracion
-    if not codigo_integracion:
-        codigo_integracion = "—"
+    canal_obj = g("canaldelivery") or {}
+    canal = (canal_obj.get("canaldelivery_descripcion") or g("canaldelivery_descripcion") or "").strip() or "—"
+    fecha_hora = (g("delivery_fecha") or "").strip()
+    if len(fecha_hora) >= 10:
+        fecha, hora = fecha_hora[:10], fecha_hora[11:19]
+    else:
+        fecha, hora = "", ""
+    importe = (g("delivery_importe") or "").strip()
     return {
-        "Codigo integracion": codigo_integracion,
+        "Codigo integracion": _row_codigo_integracion(row),
         "Cliente": cliente,
         "Canal de delivery": canal,
         "Monto pagado": importe if importe else None,
         "Fecha": fecha,
         "Hora": hora,
-        "delivery_id": (row.get("delivery_id") or "").strip(),
-        "delivery_identificadorunico": (row.get("delivery_identificadorunico") or "").strip(),
-        "delivery_orderid_canal": (row.get("delivery_codigolimadelivery_orderid") or "").strip(),
-        "delivery_celular": (row.get("delivery_celular") or "").strip(),
+        "delivery_id": (g("delivery_id") or "").strip(),
+        "delivery_identificadorunico": (g("delivery_identificadorunico") or "").strip(),
+        "delivery_orderid_canal": (g("delivery_codigolimadelivery_orderid") or "").strip(),
+        "delivery_celular": (g("delivery_celular") or "").strip(),
     }
 
 
@@ -1561,56 +1879,62 @@ def _delivery_auth_header(token: str | None) -> dict[str, str]:
     return {"Authorization": f'Token token="{token}"'}
 
 
+async def _fetch_deliverys_page(
+    client: "httpx.AsyncClient",
+    local_id: str,
+    page: int,
+    page_size: int,
+    cookies_dict: dict[str, str],
+    headers: dict[str, str],
+) -> tuple[list[dict], bool]:
+    """Una página de deliverys del local: (filas, si puede haber más páginas)."""
+    offset = (page - 1) * page_size
+    url = f"{DELIVERY_API_BASE}/obtenerDeliverysPorLocalSimple/{local_id}/{page}/{page_size}/{offset}"
+    try:
+        resp = await client.get(url, cookies=cookies_dict, headers=headers)
+    except Exception:
+        return [], False
+    if resp.status_code != 200:
+        return [], False
+    try:
+        body = _json_loads(resp.content)
+    except Exception:
+        return [], False
+    if not isinstance(body, dict):
+        # La API a veces devuelve la lista directamente (sin paginar)
+        return (body if isinstance(body, list) else []), False
+    if body.get("tipo") == "401":
+        return [], False
+    data = body.get("data") if isinstance(body.get("data"), list) else []
+    return data, len(data) >= page_size
+
+
 async def _fetch_deliverys_for_local(
     client: "httpx.AsyncClient",
     local_id: str,
     cookies_dict: dict[str, str],
     token: str | None,
 ) -> list[dict]:
-    """Obtiene como máximo los primeros 100 deliverys del local (paginación 50 en 50)."""
-    import httpx
+    """Obtiene como máximo los primeros 100 deliverys del local (páginas de 50 pedidas en paralelo)."""
     headers = _delivery_auth_header(token)
-    page = 1
     page_size = 50
-    offset = 0
-    all_data: list[dict] = []
-    while len(all_data) < _DELIVERYS_MAX_PER_LOCAL:
-        url = f"{DELIVERY_API_BASE}/obtenerDeliverysPorLocalSimple/{local_id}/{page}/{page_size}/{offset}"
-        try:
-            resp = await client.get(url, cookies=cookies_dict, headers=headers)
-        except Exception:
-            break
-        if resp.status_code != 200:
-            break
-        try:
-            body = resp.json()
-        except Exception:
-            break
-        if not isinstance(body, dict):
-            # La API a veces devuelve la lista directamente
-            if isinstance(body, list):
-                data = body
-            else:
-                data = []
-            if data:
-                all_data.extend(data)
-                if len(all_data) >= _DELIVERYS_MAX_PER_LOCAL:
-                    all_data = all_data[:_DELIVERYS_MAX_PER_LOCAL]
-            break
-        if body.get("tipo") == "401":
-            break
-        data = body.get("data") if isinstance(body.get("data"), list) else []
-        if not data:
-            break
+    n_pages = -(-_DELIVERYS_MAX_PER_LOCAL // page_size)
+    # Página 1 sola: en el caso común (local con pocos pedidos) no hace falta pedir más
+    first, more = await _fetch_deliverys_page(client, local_id, 1, page_size, cookies_dict, headers)
+    if not more or n_pages <= 1:
+        return first[:_DELIVERYS_MAX_PER_LOCAL]
+    pages = await asyncio.gather(
+        *(
+            _fetch_deliverys_page(client, local_id, page, page_size, cookies_dict, headers)
+            for page in range(2, n_pages + 1)
+        )
+    )
+    all_data: list[dict] = list(first)
+    for data, more in pages:
         all_data.extend(data)
-        if len(all_data) >= _DELIVERYS_MAX_PER_LOCAL:
-            all_data = all_data[:_DELIVERYS_MAX_PER_LOCAL]
-            break
-        if len(data) < page_size:
+        if not more:
             break
-        offset += page_size
-        page += 1
-    return all_data
+    return all_data[:_DELIVERYS_MAX_PER_LOCAL]
 
 
 def _migrate_old_deliverys_to_per_date() -> None:
@@ -1662,6 +1986,92 @@ def _looks_like_didi_display_num(cod: str) -> bool:
     return False
 
 
+# Lock por archivo de deliverys: el guardado del scheduler y el cruce Didi hacen leer-modificar-escribir desde hilos
+_deliverys_file_locks: dict[Path, threading.Lock] = {}
+_deliverys_file_locks_guard = threading.Lock()
+
+
+def _deliverys_file_lock(filepath: Path) -> threading.Lock:
+    with _deliverys_file_locks_guard:
+        lock = _deliverys_file_locks.get(filepath)
+        if lock is None:
+            lock = _deliverys_file_locks[filepath] = threading.Lock()
+        return lock
+
+
+def _merge_deliverys_file(filepath: Path, new_rows: list[dict], fetched_at: str, only_date: str | None = None) -> int:
+    """
+    Fusiona new_rows en el archivo de deliverys (clave delivery_id) y lo reescribe. Devuelve el total de filas.
+    Si only_date está definida, las filas existentes de otro día se descartan.
+    Si una fila existente ya tiene delivery_codigolimadelivery como displayNum Didi (#xxx), se preserva.
+    Si ninguna fila cambia respecto a lo que ya hay en disco no se reescribe (fetched_at queda en la última consulta con cambios);
+    las filas ya fusionadas se recuerdan en memoria mientras el archivo no cambie.
+    """
+    with _deliverys_file_lock(filepath):
+        return _merge_deliverys_file_locked(filepath, new_rows, fetched_at, only_date)
+
+
+# Filas de cada archivo de deliverys tal como quedaron en disco tras la última fusión:
+# path -> ((mtime_ns, size), only_date, {delivery_id: fila}). Evita releer y parsear el JSON completo en cada consulta.
+_deliverys_rows_cache: dict[Path, tuple[tuple[int, int] | None, str | None, dict[str, dict]]] = {}
+
+
+def _merge_deliverys_file_locked(filepath: Path, new_rows: list[dict], fetched_at: str, only_date: str | None) -> int:
+    key = _file_stat_key(filepath)
+    hit = _deliverys_rows_cache.get(filepath)
+    changed = False
+    if key is not None and hit is not None and hit[0] == key and hit[1] == only_date:
+        existing_by_id = dict(hit[2])
+    else:
+        existing_by_id = {}
+        if key is not None:
+            cached = _read_json(filepath, {})
+            on_disk_rows = None
+            if isinstance(cached, list):
+                existing_list = cached
+            else:
+                existing_list = (cached.get("data") or []) if isinstance(cached.get("data"), list) else []
+                on_disk_rows = cached.get("data")
+            existing_by_id = {
+                (r.get("delivery_id") or "").strip() or f"__existing_{i}": r
+                for i, r in enumerate(existing_list)
+                if isinstance(r, dict) and (not only_date or (r.get("delivery_fecha") or "").strip()[:10] == only_date)
+            }
+            # Formato legacy, filas de otro día o duplicadas: hay que reescribir aunque no llegue nada nuevo
+            changed = on_disk_rows is None or len(existing_by_id) != len(on_disk_rows)
+    # Partición en una pasada: filas con delivery_id (caso normal, indexadas) y sin él (se agregan al final)
+    with_id: dict[str, dict] = {}
+    without_id: list[dict] = []
+    for r in new_rows:
+        did = (r.get("delivery_id") or "").strip()
+        if did:
+            with_id[did] = r
+        else:
+            without_id.append(r)
+    for did, r in with_id.items():
+        existing_row = existing_by_id.get(did)
+        if existing_row:
+            didi_num = (existing_row.get("delivery_codigolimadelivery") or "").strip()
+            if _looks_like_didi_display_num(didi_num):
+                r = dict(r)
+                r["delivery_codigolimadelivery"] = didi_num
+        if existing_row != r:
+            existing_by_id[did] = r
+            changed = True
+    for r in without_id:
+        existing_by_id[f"__new_{len(existing_by_id)}"] = r
+        changed = True
+    if changed:
+        _write_json(filepath, {"fetched_at": fetched_at, "data": list(existing_by_id.values())})
+        key = _file_stat_key(filepath)
+    # Solo se guarda el archivo más reciente de cada local (los de días anteriores ya no se fusionan)
+    for other in list(_deliverys_rows_cache):
+        if other.parent == filepath.parent and other != filepath:
+            _deliverys_rows_cache.pop(other, None)
+    _deliverys_rows_cache[filepath] = (key, only_date, existing_by_id)
+    return len(existing_by_id)
+
+
 def _save_deliverys_for_local(local_id: str, data: list[dict], consultation_date: str | None = None) -> None:
     """
     Guarda deliverys en reports/deliverys/{local_id}/{fecha}.json.
@@ -1676,89 +2086,44 @@ def _save_deliverys_for_local(local_id: str, data: list[dict], consultation_date
     local_dir.mkdir(parents=True, exist_ok=True)
     fetched_at = _now_colombia_str()
 
+    by_date: dict[str, list[dict]] = defaultdict(list)
     if consultation_date:
         # Un solo archivo con la fecha de consulta; solo órdenes cuya delivery_fecha es ese día
         date_str = (consultation_date or "").strip()[:10]
         if not date_str:
             return
-        filepath = local_dir / f"{date_str}.json"
-        existing_by_id: dict[str, dict] = {}
-        if filepath.exists():
-            cached = _read_json(filepath, {})
-            if isinstance(cached, list):
-                existing_list = cached
-            else:
-                existing_list = (cached.get("data") or []) if isinstance(cached.get("data"), list) else []
-            for i, r in enumerate(existing_list):
-                if not isinstance(r, dict):
-                    continue
-                row_fecha = (r.get("delivery_fecha") or "").strip()[:10]
-                if row_fecha != date_str:
-                    continue
-                did = (r.get("delivery_id") or "").strip()
-                key = did if did else f"__existing_{i}"
-                existing_by_id[key] = r
+        by_date[date_str] = [
+            row for row in data
+            if isinstance(row, dict) and (row.get("delivery_fecha") or "").strip()[:10] == date_str
+        ]
+    else:
         for row in data:
             if not isinstance(row, dict):
                 continue
-            row_fecha = (row.get("delivery_fecha") or "").strip()[:10]
-            if row_fecha != date_str:
-                continue
-            did = (row.get("delivery_id") or "").strip()
-            if did:
-                existing_row = existing_by_id.get(did)
-                if existing_row and _looks_like_didi_display_num((existing_row.get("delivery_codigolimadelivery") or "").strip()):
-                    row = dict(row)
-                    row["delivery_codigolimadelivery"] = (existing_row.get("delivery_codigolimadelivery") or "").strip()
-                existing_by_id[did] = row
-            else:
-                existing_by_id[f"__new_{len(existing_by_id)}"] = row
-        out = {"fetched_at": fetched_at, "data": list(existing_by_id.values())}
-        _write_json(filepath, out)
-        logger.debug("Deliverys: fusionados %s ítems para local_id=%s fecha=%s", len(out["data"]), local_id, date_str)
-        return
-
-    by_date: dict[str, list[dict]] = defaultdict(list)
-    for row in data:
-        if not isinstance(row, dict):
-            continue
-        fecha = (row.get("delivery_fecha") or "").strip()[:10]
-        if fecha:
-            by_date[fecha].append(row)
+            fecha = (row.get("delivery_fecha") or "").strip()[:10]
+            if fecha:
+                by_date[fecha].append(row)
     for date_str, new_rows in by_date.items():
-        filepath = local_dir / f"{date_str}.json"
-        existing_by_id = {}
-        if filepath.exists():
-            cached = _read_json(filepath, {})
-            if isinstance(cached, list):
-                existing_list = cached
-            else:
-                existing_list = (cached.get("data") or []) if isinstance(cached.get("data"), list) else []
-            for i, r in enumerate(existing_list):
-                if not isinstance(r, dict):
-                    continue
-                did = (r.get("delivery_id") or "").strip()
-                key = did if did else f"__existing_{i}"
-                existing_by_id[key] = r
-        for r in new_rows:
-            did = (r.get("delivery_id") or "").strip()
-            if did:
-                existing_row = existing_by_id.get(did)
-                if existing_row and _looks_like_didi_display_num((existing_row.get("delivery_codigolimadelivery") or "").strip()):
-                    r = dict(r)
-                    r["delivery_codigolimadelivery"] = (existing_row.get("delivery_codigolimadelivery") or "").strip()
-                existing_by_id[did] = r
-            else:
-                existing_by_id[f"__new_{len(existing_by_id)}"] = r
-        out = {"fetched_at": fetched_at, "data": list(existing_by_id.values())}
-        _write_json(filepath, out)
-        logger.debug("Deliverys: fusionados %s ítems para local_id=%s fecha=%s", len(out["data"]), local_id, date_str)
+        total = _merge_deliverys_file(
+            local_dir / f"{date_str}.json", new_rows, fetched_at, only_date=date_str if consultation_date else None
+        )
+        logger.debug("Deliverys: fusionados %s ítems para local_id=%s fecha=%s", total, local_id, date_str)
 
 
-def _update_canales_from_deliverys_cache() -> None:
-    """Actualiza canales_delivery.json con los canales presentes en la cache de deliverys (por local/fecha)."""
-    canales_set = set()
-    if DELIVERYS_CACHE_DIR.exists():
+def _delivery_canal_desc(row: dict) -> str:
+    """Descripción del canal de una fila de deliverys (objeto canaldelivery o campo plano)."""
+    canal_obj = row.get("canaldelivery") or {}
+    return (canal_obj.get("canaldelivery_descripcion") or row.get("canaldelivery_descripcion") or "").strip()
+
+
+def _update_canales_from_deliverys_cache(canales: set[str] | None = None) -> None:
+    """
+    Actualiza canales_delivery.json con los canales de deliverys.
+    canales: los vistos en la última consulta (en memoria). Solo si no se pasan o el archivo aún no existe
+    se recorre toda la cache (por local/fecha). Solo se escribe si aparece algún canal nuevo.
+    """
+    canales_set = set(canales or ())
+    if (canales is None or not REPORTS_CANALES_DELIVERY_JSON.exists()) and DELIVERYS_CACHE_DIR.exists():
         for json_file in DELIVERYS_CACHE_DIR.rglob("*.json"):
             if not json_file.is_file():
                 continue
@@ -1770,15 +2135,29 @@ def _update_canales_from_deliverys_cache() -> None:
             for row in data:
                 if not isinstance(row, dict):
                     continue
-                canal_obj = row.get("canaldelivery") or {}
-                desc = (canal_obj.get("canaldelivery_descripcion") or row.get("canaldelivery_descripcion") or "").strip()
+                desc = _delivery_canal_desc(row)
                 if desc:
                     canales_set.add(desc)
     if canales_set:
-        existing = list(_read_json(REPORTS_CANALES_DELIVERY_JSON, []))
-        all_canales = sorted(set(existing) | canales_set)
+        existing = set(_read_json(REPORTS_CANALES_DELIVERY_JSON, []))
+        if canales_set <= existing:
+            return
         REPORTS_CANALES_DELIVERY_JSON.parent.mkdir(parents=True, exist_ok=True)
-        _write_json(REPORTS_CANALES_DELIVERY_JSON, all_canales)
+        _write_json(REPORTS_CANALES_DELIVERY_JSON, sorted(existing | canales_set))
+
+
+_DIDI_CANAL_DESCS = frozenset({"Didi Food"})
+
+
+def _is_didi_canal(row: dict) -> bool:
+    """True si la fila es del canal Didi Food (descripción en canaldelivery o en la fila)."""
+    canal_obj = row.get("canaldelivery")
+    desc = (canal_obj.get("canaldelivery_descripcion") if isinstance(canal_obj, dict) else None) or row.get(
+        "canaldelivery_descripcion"
+    )
+    if desc in _DIDI_CANAL_DESCS:
+        return True
+    return isinstance(desc, str) and desc.strip() in _DIDI_CANAL_DESCS
 
 
 def _build_restaurant_map_for_date(date_str: str) -> None:
@@ -1800,11 +2179,7 @@ def _build_restaurant_map_for_date(date_str: str) -> None:
         cached = _read_json(filepath, {})
         data = cached.get("data") if isinstance(cached, dict) and isinstance(cached.get("data"), list) else []
         for row in data:
-            if not isinstance(row, dict):
-                continue
-            canal_obj = row.get("canaldelivery") or {}
-            desc = (canal_obj.get("canaldelivery_descripcion") or row.get("canaldelivery_descripcion") or "").strip()
-            if desc != "Didi Food":
+            if not isinstance(row, dict) or not _is_didi_canal(row):
                 continue
             cod = (row.get("delivery_codigolimadelivery") or "").strip()
             if not cod:
@@ -1819,8 +2194,69 @@ def _build_restaurant_map_for_date(date_str: str) -> None:
     logger.debug("Restaurant map: %s escrita para %s (%s locales)", out_path.name, date_str, len(by_local))
 
 
+def _unify_fotos_codigo(cod: str, display_num: str) -> None:
+    """Copia uploads/{codigo_lima} -> uploads/{displayNum sin #} para no perder fotos (no sobrescribe)."""
+    src_base = UPLOADS_DIR / _sanitize_codigo(cod)
+    if not (src_base.exists() and src_base.is_dir()):
+        return
+    dst_base = UPLOADS_DIR / _sanitize_codigo(display_num)
+    dst_base.mkdir(parents=True, exist_ok=True)
+    for sub in ("entrega", "apelacion", "respuestas"):
+        src_sub = src_base / sub
+        if not src_sub.is_dir():
+            continue
+        dst_sub = dst_base / sub
+        dst_sub.mkdir(parents=True, exist_ok=True)
+        for f in src_sub.rglob("*"):
+            if f.is_file():
+                rel = f.relative_to(src_sub)
+                dest_file = dst_sub / rel
+                dest_file.parent.mkdir(parents=True, exist_ok=True)
+                if not dest_file.exists():
+                    try:
+                        shutil.copy2(f, dest_file)
+                    except OSError as e:
+                        logger.warning("No se pudo copiar foto %s -> %s: %s", f, dest_file, e)
+
+
+def _apply_didi_map_to_file(filepath: Path, didi_map: dict) -> bool:
+    """Reemplaza en un archivo de deliverys el id de Didi por su displayNum ya normalizado. True si el archivo cambió."""
+    with _deliverys_file_lock(filepath):
+        return _apply_didi_map_to_file_locked(filepath, didi_map)
+
+
+def _apply_didi_map_to_file_locked(filepath: Path, didi_map: dict) -> bool:
+    if not filepath.exists():
+        return False
+    cached = _read_json(filepath, {})
+    data = cached.get("data") if isinstance(cached, dict) and isinstance(cached.get("data"), list) else []
+    if not data:
+        return False
+    # Columna de códigos una vez; la intersección con el mapa (en C) dice si hay algo que hacer en este archivo
+    cods = [(row.get("delivery_codigolimadelivery") or "").strip() if isinstance(row, dict) else "" for row in data]
+    matches = didi_map.keys() & set(cods)
+    if not matches:
+        return False
+    changed = False
+    for row, cod in zip(data, cods):
+        if cod not in matches:
+            continue
+        display_num = didi_map[cod]
+        # Primero unificar fotos para no perderlas al cambiar el código
+        _unify_fotos_codigo(cod, display_num)
+        # Reemplazar el id por el displayNum (así Codigo integracion y fotos usan el mismo valor)
+        row["delivery_codigolimadelivery"] = display_num
+        changed = True
+    if changed:
+        cached["data"] = data
+        _write_json(filepath, cached)
+    return changed
+
+
 def _cross_didi_map_and_update_orders(date_str: str) -> None:
     """Cruza restaurant_map con didi_restaurant_map; actualiza filas con delivery_displaynum_didi y unifica fotos en uploads."""
+    from concurrent.futures import ThreadPoolExecutor
+
     date_str = (date_str or "").strip()[:10]
     if not date_str:
         return
@@ -1834,79 +2270,35 @@ def _cross_didi_map_and_update_orders(date_str: str) -> None:
     didi_map = _read_json(didi_map_path, {})
     if not isinstance(didi_map, dict):
         return
-    # didi_map: orderId (codigo_lima) -> displayNum (ej. "#597026")
-    updates_by_file: dict[Path, list[dict]] = {}  # filepath -> list of rows to write back
+    # didi_map: orderId (codigo_lima) -> displayNum (ej. "#597026"); se normaliza una vez, no por fila
+    didi_map = {
+        sys.intern(str(k).strip()): disp
+        for k, v in didi_map.items()
+        if v and (disp := _normalize_didi_display_num(v))
+    }
+    # Por local, solo los códigos Didi del restaurant_map que están en el mapa: si no hay ninguno no se abre el archivo
+    jobs: list[tuple[Path, dict[str, str]]] = []
     for local_id, codigos in by_local.items():
-        if not codigos:
-            continue
-        filepath = DELIVERYS_CACHE_DIR / local_id / f"{date_str}.json"
-        if not filepath.exists():
-            continue
-        cached = _read_json(filepath, {})
-        data = cached.get("data") if isinstance(cached, dict) and isinstance(cached.get("data"), list) else []
-        if not data:
-            continue
-        changed = False
-        for row in data:
-            if not isinstance(row, dict):
-                continue
-            cod = (row.get("delivery_codigolimadelivery") or "").strip()
-            if cod not in didi_map:
-                continue
-            display_num = didi_map.get(cod)
-            if not display_num:
-                continue
-            if isinstance(display_num, str):
-                display_num = display_num.strip()
-            display_num = _normalize_didi_display_num(display_num)
-            if not display_num:
-                continue
-            # Primero unificar fotos: copiar uploads/{codigo_lima} -> uploads/{displayNum sin #} para no perder fotos
-            src_base = UPLOADS_DIR / _sanitize_codigo(cod)
-            if src_base.exists() and src_base.is_dir():
-                dst_base = UPLOADS_DIR / _sanitize_codigo(display_num)
-                dst_base.mkdir(parents=True, exist_ok=True)
-                for sub in ("entrega", "apelacion", "respuestas"):
-                    src_sub = src_base / sub
-                    if not src_sub.is_dir():
-                        continue
-                    dst_sub = dst_base / sub
-                    dst_sub.mkdir(parents=True, exist_ok=True)
-                    for f in src_sub.rglob("*"):
-                        if f.is_file():
-                            rel = f.relative_to(src_sub)
-                            dest_file = dst_sub / rel
-                            dest_file.parent.mkdir(parents=True, exist_ok=True)
-                            if not dest_file.exists():
-                                try:
-                                    shutil.copy2(f, dest_file)
-                                except OSError as e:
-                                    logger.warning("No se pudo copiar foto %s -> %s: %s", f, dest_file, e)
-            # Reemplazar el id por el displayNum (así Codigo integracion y fotos usan el mismo valor)
-            row["delivery_codigolimadelivery"] = display_num
-            changed = True
-        if changed:
-            updates_by_file[filepath] = data
-            cached["data"] = data
-            _write_json(filepath, cached)
-    if updates_by_file:
-        logger.debug("Didi map cruzado para %s: actualizados %s archivos deliverys", date_str, len(updates_by_file))
+        local_map = {c: didi_map[c] for c in codigos or () if c in didi_map}
+        if local_map:
+            jobs.append((DELIVERYS_CACHE_DIR / local_id / f"{date_str}.json", local_map))
+    if not jobs:
+        return
+    # Un archivo por local: lectura/escritura independientes, se procesan en paralelo (I/O)
+    with ThreadPoolExecutor(max_workers=min(8, len(jobs))) as pool:
+        changed_count = sum(pool.map(lambda job: _apply_didi_map_to_file(*job), jobs))
+    if changed_count:
+        logger.debug("Didi map cruzado para %s: actualizados %s archivos deliverys", date_str, changed_count)
 
 
-def _locale_id(item: dict[str, str] | str) -> str:
-    """Extrae el id del local de un ítem (dict con 'id' o vacío)."""
-    if isinstance(item, dict):
-        return (item.get("id") or "").strip()
-    return ""
+def _locale_id(item: dict[str, str]) -> str:
+    """Id del local de un ítem de _locales_list_for_iteration ("" si es un local legacy sin id)."""
+    return item["id"]
 
 
 def _get_local_id_by_name(local_name: str) -> str | None:
-    """Devuelve el local_id para un nombre de local (desde locales.json)."""
-    for item in _locales_list_for_iteration():
-        if _locale_name(item) == (local_name or "").strip():
-            lid = _locale_id(item) if isinstance(item, dict) else ""
-            return lid if lid else None
-    return None
+    """Devuelve el local_id para un nombre de local (desde locales.json)."""
+    return _locales_cached()["id_by_name"].get((local_name or "").strip())
 
 
 def _get_orders_for_local_date(local: str, fecha: str) -> list[dict]:
@@ -1914,13 +2306,110 @@ def _get_orders_for_local_date(local: str, fecha: str) -> list[dict]:
     local_id = _get_local_id_by_name(local)
     if not local_id:
         return []
-    date_str = fecha.strip()[:10]
+    return _orders_copy_for_local_id_date(local_id, fecha.strip()[:10])
+
+
+def _orders_copy_for_local_id_date(local_id: str, date_str: str) -> list[dict]:
+    """Órdenes del día como dicts propios (los llamadores les agregan campos); parte de la cache por archivo."""
     filepath = DELIVERYS_CACHE_DIR / local_id / f"{date_str}.json"
     if not filepath.exists():
         return []
-    cached = _read_json(filepath, {})
-    data = cached.get("data") if isinstance(cached.get("data"), list) else []
-    return [_delivery_row_to_order(row) for row in data]
+    return [dict(o) for o in _orders_for_file(filepath)]
+
+
+# Por archivo de deliverys: path -> {"key": (mtime_ns, size), "rows": filas crudas hasta convertirlas,
+# "orders": órdenes convertidas (perezoso), "por_canal": órdenes con código por canal}. Acotado a los más recientes.
+# Se usa desde el threadpool de FastAPI y desde los pools de los informes: consulta, inserción y desalojo van
+# bajo _orders_file_cache_lock; el parseo del archivo se hace fuera del lock.
+_orders_file_cache: dict[Path, dict[str, Any]] = {}
+_ORDERS_FILE_CACHE_MAX = 4096
+_orders_file_cache_lock = threading.Lock()
+
+
+def _orders_file_entry(json_file: Path) -> dict[str, Any]:
+    key = _file_stat_key(json_file)
+    with _orders_file_cache_lock:
+        hit = _orders_file_cache.get(json_file)
+    if hit is not None and hit["key"] == key:
+        return hit
+    cached = _read_json(json_file, {})
+    data = cached.get("data") if isinstance(cached, dict) and isinstance(cached.get("data"), list) else []
+    # Conteo por canal de las órdenes con código (las que cuentan en informes), por columnas: sin armar cada orden
+    por_canal = dict(Counter(
+        _delivery_canal_desc(row) or "—"
+        for row in data
+        if _row_codigo_integracion(row) != "—"
+    ))
+    entry = {"key": key, "rows": data, "orders": None, "por_canal": por_canal}
+    with _orders_file_cache_lock:
+        _orders_file_cache.pop(json_file, None)
+        if len(_orders_file_cache) >= _ORDERS_FILE_CACHE_MAX:
+            # Sale la entrada más antigua (orden de inserción)
+            _orders_file_cache.pop(next(iter(_orders_file_cache)), None)
+        _orders_file_cache[json_file] = entry
+    return entry
+
+
+def _orders_for_file(json_file: Path) -> tuple[dict, ...]:
+    """
+    Órdenes (formato _delivery_row_to_order) de un archivo de deliverys; solo se vuelve a leer y convertir
+    si el archivo cambió. Compartidas entre peticiones: no modificar (copiar con dict(o) si hace falta).
+    """
+    entry = _orders_file_entry(json_file)
+    # Leer rows antes que orders: quien convierte publica orders antes de soltar rows (seguro entre hilos)
+    rows = entry["rows"]
+    orders = entry["orders"]
+    if orders is None:
+        orders = entry["orders"] = tuple(map(_delivery_row_to_order, rows))
+        entry["rows"] = ()
+    return orders
+
+
+def _orders_por_canal_for_file(json_file: Path) -> dict[str, int]:
+    """Cantidad de órdenes con código por canal en un archivo de deliverys (misma cache; no modificar)."""
+    return _orders_file_entry(json_file)["por_canal"]
+
+
+def _row_codigos(row: dict) -> tuple[str, ...]:
+    """Códigos por los que se puede buscar una fila: código integración (con y sin #), identificador único, orden canal."""
+    cod_lima = (row.get("delivery_codigolimadelivery") or row.get("delivery_codigointegracion") or "").strip()
+    identificador = (row.get("delivery_identificadorunico") or "").strip()
+    orderid_canal = (row.get("delivery_codigolimadelivery_orderid") or "").strip()
+    cod_lima_norm = _normalize_didi_display_num(cod_lima) or cod_lima
+    return tuple(c for c in (cod_lima, cod_lima_norm, identificador, orderid_canal) if c)
+
+
+# Índice en memoria por archivo de deliverys: path -> ((mtime_ns, size), {codigo: posición de la primera fila}).
+# Acotado y protegido igual que _orders_file_cache (mismo tope y mismo lock).
+_codigo_index: dict[Path, tuple[tuple[int, int] | None, dict[str, int]]] = {}
+
+
+def _codigo_index_for_file(json_file: Path) -> dict[str, int]:
+    """Índice código -> fila del archivo; solo se vuelve a parsear el JSON si el archivo cambió."""
+    key = _file_stat_key(json_file)
+    with _orders_file_cache_lock:
+        hit = _codigo_index.get(json_file)
+        if key is None and hit is not None:
+            # El archivo ya no existe: no se guarda nada más para él
+            _codigo_index.pop(json_file, None)
+    if hit is not None and hit[0] == key:
+        return hit[1]
+    cached = _read_json(json_file, {})
+    data = cached.get("data") if isinstance(cached, dict) and isinstance(cached.get("data"), list) else []
+    index: dict[str, int] = {}
+    for i, row in enumerate(data):
+        if isinstance(row, dict):
+            for c in _row_codigos(row):
+                index.setdefault(c, i)
+    if key is None:
+        return index
+    with _orders_file_cache_lock:
+        _codigo_index.pop(json_file, None)
+        if len(_codigo_index) >= _ORDERS_FILE_CACHE_MAX:
+            # Sale la entrada más antigua (orden de inserción)
+            _codigo_index.pop(next(iter(_codigo_index)), None)
+        _codigo_index[json_file] = (key, index)
+    return index
 
 
 def _find_order_by_codigo(codigo: str) -> dict | None:
@@ -1934,14 +2423,13 @@ def _find_order_by_codigo(codigo: str) -> dict | None:
         if not local_dir.is_dir():
             continue
         for json_file in local_dir.glob("*.json"):
+            if cod not in _codigo_index_for_file(json_file):
+                continue
+            # Releer solo el archivo que lo contiene (por si cambió entre el índice y la lectura, se busca en las filas)
             cached = _read_json(json_file, {})
-            data = cached.get("data") if isinstance(cached.get("data"), list) else []
+            data = cached.get("data") if isinstance(cached, dict) and isinstance(cached.get("data"), list) else []
             for row in data:
-                cod_lima = (row.get("delivery_codigolimadelivery") or row.get("delivery_codigointegracion") or "").strip()
-                identificador = (row.get("delivery_identificadorunico") or "").strip()
-                orderid_canal = (row.get("delivery_codigolimadelivery_orderid") or "").strip()
-                cod_lima_norm = _normalize_didi_display_num(cod_lima) or cod_lima
-                if cod_lima == cod or cod_lima_norm == cod or identificador == cod or orderid_canal == cod:
+                if isinstance(row, dict) and cod in _row_codigos(row):
                     return _delivery_row_to_order(row)
     return None
 
@@ -1979,6 +2467,24 @@ def _find_orders_by_codigo_partial(query: str, limit: int = 30) -> list[dict]:
     return results
 
 
+def _scandir_names(folder: Path, dirs: bool = False) -> list[str]:
+    """Nombres de archivos (o subcarpetas si dirs=True) de folder; [] si no existe. scandir evita un stat por entrada."""
+    try:
+        with os.scandir(folder) as it:
+            return [e.name for e in it if (e.is_dir() if dirs else e.is_file())]
+    except OSError:
+        return []
+
+
+def _dir_has_entry(folder: Path, files_only: bool = False) -> bool:
+    """True si folder existe y tiene al menos una entrada (o un archivo); se detiene en la primera."""
+    try:
+        with os.scandir(folder) as it:
+            return any(e.is_file() for e in it) if files_only else next(it, None) is not None
+    except OSError:
+        return False
+
+
 def _get_fotos_for_codigo(codigo: str) -> dict:
     """Devuelve { entrega: [urls], apelacion: { canal: [urls] } } para un código (carpeta uploads)."""
     cod = (codigo or "").strip().lstrip("#")
@@ -1986,14 +2492,12 @@ def _get_fotos_for_codigo(codigo: str) -> dict:
     out = {"entrega": [], "apelacion": {}}
     if not base.exists():
         return out
-    entrega_folder = base / "entrega"
-    if entrega_folder.is_dir():
-        out["entrega"] = [f"/api/orders/{cod}/fotos/entrega/{f.name}" for f in entrega_folder.iterdir() if f.is_file()]
+    out["entrega"] = [f"/api/orders/{cod}/fotos/entrega/{name}" for name in _scandir_names(base / "entrega")]
     apelacion_dir = base / "apelacion"
-    if apelacion_dir.is_dir():
-        for canal_dir in apelacion_dir.iterdir():
-            if canal_dir.is_dir():
-                out["apelacion"][canal_dir.name] = [f"/api/orders/{cod}/fotos/apelacion/{canal_dir.name}/{f.name}" for f in canal_dir.iterdir() if f.is_file()]
+    for canal in _scandir_names(apelacion_dir, dirs=True):
+        out["apelacion"][canal] = [
+            f"/api/orders/{cod}/fotos/apelacion/{canal}/{name}" for name in _scandir_names(apelacion_dir / canal)
+        ]
     return out
 
 
@@ -2011,10 +2515,30 @@ def _foto_codigo_candidates(order: dict) -> list[str]:
     return out
 
 
-def _get_fotos_for_order(order: dict) -> dict:
-    """Fotos de la orden probando todas las referencias (codigo integración e identificador unico). Así funcionan las que ya tienen foto en otra carpeta."""
+def _uploads_folder_names() -> set[str]:
+    """Carpetas que hay en uploads/ (una sola lectura del directorio); para listados con muchas órdenes."""
+    return set(_scandir_names(UPLOADS_DIR, dirs=True))
+
+
+def _may_have_uploads(codigo: str, folders: set[str] | None) -> bool:
+    """False si, según la lectura previa de uploads/, el código no tiene carpeta (ni la variante legacy con #)."""
+    if folders is None:
+        return True
+    cod = (codigo or "").strip().lstrip("#")
+    if _sanitize_codigo(cod) in folders:
+        return True
+    return cod.isdigit() and _sanitize_codigo("#" + cod) in folders
+
+
+def _get_fotos_for_order(order: dict, folders: set[str] | None = None) -> dict:
+    """
+    Fotos de la orden probando todas las referencias (codigo integración e identificador unico). Así funcionan las que ya tienen foto en otra carpeta.
+    folders: resultado de _uploads_folder_names() para no mirar en disco las referencias sin carpeta.
+    """
     merged = {"entrega": [], "apelacion": {}}
     for cod in _foto_codigo_candidates(order):
+        if not _may_have_uploads(cod, folders):
+            continue
         fotos = _get_fotos_for_codigo(cod)
         for url in fotos.get("entrega", []):
             if url not in merged["entrega"]:
@@ -2087,12 +2611,28 @@ def _organize_foto_refs() -> dict:
     return {"moved": moved, "errors": errors, "message": f"Organizadas {len(moved)} carpetas" if moved else "Nada que organizar"}
 
 
+# delivery_id marcados como no entregada; se vuelve a leer no_entregadas.json solo si cambia (otro worker)
+_no_entregadas_cache: dict[str, Any] = {"key": None, "set": set()}
+_no_entregadas_lock = threading.Lock()
+
+
 def _get_no_entregadas_set() -> set[str]:
-    """Lee la lista de delivery_id marcados como no entregada."""
-    data = _read_json(NO_ENTREGADAS_JSON, [])
-    if not isinstance(data, list):
-        return set()
-    return {str(x).strip() for x in data if x}
+    """Lee la lista de delivery_id marcados como no entregada (no modificar el set devuelto)."""
+    key = _file_stat_key(NO_ENTREGADAS_JSON)
+    if key is not None and key == _no_entregadas_cache["key"]:
+        return _no_entregadas_cache["set"]
+    data = _read_json(NO_ENTREGADAS_JSON, []) if key is not None else []
+    ids_set = {str(x).strip() for x in data if x} if isinstance(data, list) else set()
+    _no_entregadas_cache["key"] = key
+    _no_entregadas_cache["set"] = ids_set
+    return ids_set
+
+
+def _save_no_entregadas(ids_set: set[str]) -> None:
+    NO_ENTREGADAS_JSON.parent.mkdir(parents=True, exist_ok=True)
+    _write_json(NO_ENTREGADAS_JSON, sorted(ids_set))
+    _no_entregadas_cache["key"] = _file_stat_key(NO_ENTREGADAS_JSON)
+    _no_entregadas_cache["set"] = ids_set
 
 
 def _mark_no_entregada(delivery_id: str) -> None:
@@ -2100,10 +2640,10 @@ def _mark_no_entregada(delivery_id: str) -> None:
     did = (delivery_id or "").strip()
     if not did:
         return
-    ids_set = _get_no_entregadas_set()
-    ids_set.add(did)
-    NO_ENTREGADAS_JSON.parent.mkdir(parents=True, exist_ok=True)
-    _write_json(NO_ENTREGADAS_JSON, sorted(ids_set))
+    with _no_entregadas_lock:
+        ids_set = _get_no_entregadas_set()
+        if did not in ids_set:
+            _save_no_entregadas(ids_set | {did})
     logger.info("No entregada: marcado delivery_id=%s", did)
 
 
@@ -2112,12 +2652,11 @@ def _unmark_no_entregada(delivery_id: str) -> None:
     did = (delivery_id or "").strip()
     if not did:
         return
-    ids_set = _get_no_entregadas_set()
-    if did not in ids_set:
-        return
-    ids_set.discard(did)
-    NO_ENTREGADAS_JSON.parent.mkdir(parents=True, exist_ok=True)
-    _write_json(NO_ENTREGADAS_JSON, sorted(ids_set))
+    with _no_entregadas_lock:
+        ids_set = _get_no_entregadas_set()
+        if did not in ids_set:
+            return
+        _save_no_entregadas(ids_set - {did})
     logger.info("No entregada: quitada marca delivery_id=%s (foto de entrega subida)", did)
 
 
@@ -2125,41 +2664,158 @@ def _order_has_entrega_photo(codigo: str) -> bool:
     """True si la orden tiene al menos una foto en uploads (misma lógica que servir fotos: base + fallback sin #)."""
     if not (codigo or "").strip() or (codigo or "").strip() == "—":
         return False
-    base = _uploads_base_for_codigo(codigo) / "entrega"
-    return base.is_dir() and any(base.iterdir())
+    return _dir_has_entry(_uploads_base_for_codigo(codigo) / "entrega")
 
 
-def _order_has_entrega_photo_from_order(order: dict) -> bool:
+def _order_has_entrega_photo_from_order(order: dict, folders: set[str] | None = None) -> bool:
     """True si la orden tiene foto de entrega en alguna de sus referencias (codigo integración o identificador unico)."""
     for cod in _foto_codigo_candidates(order):
-        if _order_has_entrega_photo(cod):
+        if _may_have_uploads(cod, folders) and _order_has_entrega_photo(cod):
             return True
     return False
 
 
 # --- Apelaciones (marcar para apelar / apelar / reporte) ---
 
-def _read_apelaciones() -> dict:
+# apelaciones.json ya parseado junto con todo lo que se deriva de él, en un snapshot que se reemplaza entero
+# (nunca se completa por partes): se vuelve a leer solo si cambia el mtime/tamaño (o tras _write_apelaciones)
+_apelaciones_cache: dict[str, Any] = {"snapshot": None}
+_apelaciones_lock = threading.Lock()
+
+
+def _load_apelaciones_file() -> dict:
+    """apelaciones.json recién parseado; {"items": []} si no existe o no tiene la forma esperada."""
     data = _read_json(APELACIONES_JSON, {"items": []})
-    if not isinstance(data, dict) or "items" not in data:
-        return {"items": []}
-    if not isinstance(data["items"], list):
-        return {"items": []}
+    if not isinstance(data, dict) or "items" not in data or not isinstance(data["items"], list):
+        data = {"items": []}
     return data
 
 
+def _build_apelaciones_snapshot(key: tuple[int, int] | None) -> dict[str, Any]:
+    """Lee apelaciones.json y calcula sus estructuras derivadas de esa misma carga."""
+    data = _load_apelaciones_file()
+    norm = [
+        (item, (item.get("codigo") or "").strip(), (item.get("local") or "").strip(), item.get("fecha") or "")
+        for item in data["items"]
+    ]
+    # Índice código -> posición (gana el primero, igual que la búsqueda lineal)
+    index: dict[str, int] = {}
+    for i, (_, cod, _, _) in enumerate(norm):
+        if cod:
+            index.setdefault(cod, i)
+    # Montos por posición, alineados con items
+    montos = [_calcular_apelacion_montos(it) for it in data["items"]]
+    return {"key": key, "data": data, "norm": norm, "index": index, "montos": montos}
+
+
+def _apelaciones_snapshot() -> dict[str, Any]:
+    """
+    Snapshot vigente de apelaciones.json (solo lectura). Se construye completo bajo _apelaciones_lock y no se
+    modifica después, así que quien lo toma ve datos y estructuras derivadas de la misma carga aunque otra
+    petición lo recargue en paralelo.
+    """
+    key = _file_stat_key(APELACIONES_JSON)
+    snap = _apelaciones_cache["snapshot"]
+    if key is not None and snap is not None and snap["key"] == key:
+        return snap
+    with _apelaciones_lock:
+        snap = _apelaciones_cache["snapshot"]
+        if key is not None and snap is not None and snap["key"] == key:
+            return snap
+        snap = _build_apelaciones_snapshot(key)
+        _apelaciones_cache["snapshot"] = snap
+        return snap
+
+
+def _read_apelaciones() -> dict:
+    """Apelaciones desde cache (solo lectura: no modificar). Para modificar y guardar usar _read_apelaciones_for_update."""
+    return _apelaciones_snapshot()["data"]
+
+
+def _apelaciones_norm() -> list[tuple[dict, str, str, str]]:
+    """
+    (item, codigo, local, fecha) de cada apelación con los campos de filtro ya normalizados, calculados una vez
+    por carga del archivo. Van aparte y no dentro del item porque los items se devuelven y se guardan tal cual.
+    """
+    return _apelaciones_snapshot()["norm"]
+
+
+def _apelaciones_filtradas(local: str = "", fecha_desde: str = "", fecha_hasta: str = "") -> list[dict]:
+    """
+    Items filtrados por sede y rango de fecha (vacío = sin filtro). Se elige el bucle una vez por petición:
+    sin filtros no se evalúa nada por item, y con filtros solo los predicados activos.
+    """
+    local = (local or "").strip()
+    norm = _apelaciones_norm()
+    if not local and not fecha_desde and not fecha_hasta:
+        return [item for item, _, _, _ in norm]
+    if not fecha_desde and not fecha_hasta:
+        return [item for item, _, loc, _ in norm if loc == local]
+    # Límites abiertos: "" queda antes de cualquier fecha y "\uffff" después
+    lo = fecha_desde or ""
+    hi = fecha_hasta or "\uffff"
+    if not local:
+        return [item for item, _, _, fecha in norm if lo <= fecha <= hi]
+    return [item for item, _, loc, fecha in norm if loc == local and lo <= fecha <= hi]
+
+
+def _apelaciones_index() -> dict[str, int]:
+    """Índice código -> posición en items de _read_apelaciones() (gana el primero, igual que la búsqueda lineal)."""
+    return _apelaciones_snapshot()["index"]
+
+
+def _apelacion_item(data: dict, codigo: str) -> dict | None:
+    """
+    Item con ese código en data, una copia recién leída con _read_apelaciones_for_update (mismas posiciones
+    que la cache); si no coincide, se busca linealmente.
+    """
+    cod = (codigo or "").strip()
+    items = data.get("items", [])
+    pos = _apelaciones_index().get(cod)
+    if pos is not None and pos < len(items) and (items[pos].get("codigo") or "").strip() == cod:
+        return items[pos]
+    return next((item for item in items if (item.get("codigo") or "").strip() == cod), None)
+
+
+def _read_apelaciones_for_update() -> dict:
+    """
+    Copia propia de las apelaciones para modificarla y luego pasarla a _write_apelaciones. Se parsea de nuevo
+    el archivo (con orjson sale más barato que un deepcopy de la cache) y queda fuera del snapshot compartido.
+    """
+    return _load_apelaciones_file()
+
+
 def _write_apelaciones(data: dict) -> None:
     APELACIONES_JSON.parent.mkdir(parents=True, exist_ok=True)
     _write_json(APELACIONES_JSON, data)
+    with _apelaciones_lock:
+        _apelaciones_cache["snapshot"] = None
+
+
+def _apelaciones_not_modified(request: Request, response: Response) -> Response | None:
+    """
+    ETag (débil) del archivo de apelaciones para los endpoints de solo lectura que el admin consulta en bucle.
+    Si el cliente ya tiene esa versión devuelve un 304 listo para retornar; si no, deja el ETag en la respuesta.
+    """
+    key = _file_stat_key(APELACIONES_JSON)
+    if key is None:
+        return None
+    etag = f'W/"{key[0]:x}-{key[1]:x}"'
+    if etag in (request.headers.get("if-none-match") or ""):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return None
 
 
 def _get_apelacion_by_codigo(codigo: str) -> dict | None:
-    data = _read_apelaciones()
+    """Apelación con ese código (solo lectura). Posición e item salen del mismo snapshot y se verifica el código."""
     cod = (codigo or "").strip()
-    for item in data.get("items", []):
-        if (item.get("codigo") or "").strip() == cod:
-            return item
-    return None
+    snap = _apelaciones_snapshot()
+    pos = snap["index"].get(cod)
+    if pos is None:
+        return None
+    item = snap["data"]["items"][pos]
+    return item if (item.get("codigo") or "").strip() == cod else None
 
 
 def _total_reembolsado(item: dict) -> float:
@@ -2208,12 +2864,84 @@ def _calcular_perdida_antes_descuento(item: dict) -> float:
     return max(0.0, descontado - devuelto)
 
 
+def _apelacion_montos(item: dict) -> tuple[float, float, float, float, float]:
+    """
+    (pérdida, total reembolsado, descuentos ejecutados, descuentos programados, monto empresa asume) de una apelación.
+    Para los items de _read_apelaciones() salen de los calculados al construir el snapshot: se ubica la posición
+    por código y se exige que sea ese mismo objeto; para copias o items sueltos se calculan en el momento.
+    """
+    snap = _apelaciones_snapshot()
+    pos = snap["index"].get((item.get("codigo") or "").strip())
+    if pos is not None and snap["data"]["items"][pos] is item:
+        return snap["montos"][pos]
+    return _calcular_apelacion_montos(item)
+
+
+def _calcular_apelacion_montos(item: dict) -> tuple[float, float, float, float, float]:
+    return (
+        _calcular_perdida_antes_descuento(item),
+        _total_reembolsado(item),
+        _total_descuentos_sede(item),
+        _total_descuentos_programados(item),
+        _monto_empresa_asume(item),
+    )
+
+
 def _order_has_respuesta_foto(codigo: str) -> bool:
     """True si la orden tiene al menos una foto en respuestas (respuesta del canal). Misma base que servir fotos."""
     if not (codigo or "").strip():
         return False
-    base = _uploads_base_for_codigo(codigo) / "respuestas"
-    return base.is_dir() and any(f for f in base.iterdir() if f.is_file())
+    return _dir_has_entry(_uploads_base_for_codigo(codigo) / "respuestas", files_only=True)
+
+
+# Más días que esto en el rango: sale más barato listar la carpeta que probar fecha por fecha
+_DATE_RANGE_MAX_PROBE_DAYS = 400
+# Rango máximo aceptado por los endpoints que recorren la cache de deliverys día por día
+_MAX_RANGE_DAYS = 370
+
+
+def _validate_range(desde: str, hasta: str) -> None:
+    """400 si desde..hasta abarca más de _MAX_RANGE_DAYS días. Fechas vacías o con otro formato se dejan pasar."""
+    try:
+        d1 = datetime.strptime(desde, "%Y-%m-%d").date()
+        d2 = datetime.strptime(hasta, "%Y-%m-%d").date()
+    except ValueError:
+        return
+    if abs((d2 - d1).days) + 1 > _MAX_RANGE_DAYS:
+        raise HTTPException(status_code=400, detail=f"El rango de fechas no puede superar {_MAX_RANGE_DAYS} días")
+
+
+def _date_strs_in_range(desde: str, hasta: str) -> list[str] | None:
+    """
+    Fechas YYYY-MM-DD de desde a hasta (inclusive). None si falta alguna, no son fechas válidas
+    o el rango es demasiado largo (el llamador lista la carpeta y filtra).
+    """
+    try:
+        d1 = datetime.strptime(desde, "%Y-%m-%d").date()
+        d2 = datetime.strptime(hasta, "%Y-%m-%d").date()
+    except ValueError:
+        return None
+    days = (d2 - d1).days
+    if days > _DATE_RANGE_MAX_PROBE_DAYS:
+        return None
+    return [(d1 + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(days + 1)]
+
+
+def _deliverys_files_in_range(local_dir: Path, desde: str, hasta: str, dates: list[str] | None):
+    """(fecha, archivo) de deliverys/{local_id}/ con fecha en [desde, hasta], en orden de fecha."""
+    if dates is not None:
+        for date_str in dates:
+            json_file = local_dir / f"{date_str}.json"
+            if json_file.is_file():
+                yield date_str, json_file
+        return
+    # Un scandir y se filtra por nombre antes de crear Path u ordenar (sin fnmatch ni Path por cada archivo)
+    dates_in_dir = sorted(
+        name[:-5] for name in _scandir_names(local_dir)
+        if name.endswith(".json") and desde <= name[:-5] <= hasta
+    )
+    for date_str in dates_in_dir:
+        yield date_str, local_dir / f"{date_str}.json"
 
 
 def _get_orders_for_local_date_range(local: str, fecha_desde: str, fecha_hasta: str) -> list[dict]:
@@ -2224,21 +2952,28 @@ def _get_orders_for_local_date_range(local: str, fecha_desde: str, fecha_hasta:
         return []
     if desde > hasta:
         desde, hasta = hasta, desde  # normalizar orden
-    from datetime import datetime, timedelta
     try:
         d1 = datetime.strptime(desde, "%Y-%m-%d").date()
         d2 = datetime.strptime(hasta, "%Y-%m-%d").date()
     except ValueError:
         return []
+    local_id = _get_local_id_by_name(local)
+    if not local_id:
+        return []
+    date_list = [(d1 + timedelta(days=i)).strftime("%Y-%m-%d") for i in range((d2 - d1).days + 1)]
+    if len(date_list) > 1:
+        # Días independientes: se leen en paralelo (los que no están en cache van a disco) y se unen en orden
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=min(8, len(date_list))) as pool:
+            per_day = list(pool.map(lambda ds: _orders_copy_for_local_id_date(local_id, ds), date_list))
+    else:
+        per_day = [_orders_copy_for_local_id_date(local_id, ds) for ds in date_list]
     orders = []
-    current = d1
-    while current <= d2:
-        date_str = current.strftime("%Y-%m-%d")
-        day_orders = _get_orders_for_local_date(local, date_str)
+    for date_str, day_orders in zip(date_list, per_day):
         for o in day_orders:
             o["Fecha"] = date_str  # asegurar fecha del día
-            orders.append(o)
-        current += timedelta(days=1)
+        orders.extend(day_orders)
     return orders
 
 
@@ -2266,6 +3001,8 @@ def api_get_orders(
     desde = (fecha_desde or "").strip()[:10]
     hasta = (fecha_hasta or "").strip()[:10]
     f_single = (fecha or "").strip()[:10]
+    if use_range:
+        _validate_range(desde, hasta)
 
     orders: list[dict] = []
     for sede in sede_names:
@@ -2284,14 +3021,17 @@ def api_get_orders(
         return {"orders": []}
 
     if exclude_marcadas_apelacion:
-        apelaciones = _read_apelaciones()
-        codigos_marcados = {(item.get("codigo") or "").strip() for item in apelaciones.get("items", [])}
-        orders = [o for o in orders if (o.get("Codigo integracion") or "").strip() not in codigos_marcados]
+        # Conjunto de códigos marcados = claves del índice en cache (sin reconstruir por petición)
+        codigos_marcados = _apelaciones_index().keys()
+        if codigos_marcados:
+            orders = [o for o in orders if (o.get("Codigo integracion") or "").strip() not in codigos_marcados]
 
     no_entregadas = _get_no_entregadas_set()
+    # Una lectura de uploads/ para todo el listado: la mayoría de órdenes no tiene carpeta de fotos
+    folders = _uploads_folder_names()
     for o in orders:
-        o["has_entrega_photo"] = _order_has_entrega_photo_from_order(o)
-        fotos = _get_fotos_for_order(o)
+        o["has_entrega_photo"] = _order_has_entrega_photo_from_order(o, folders)
+        fotos = _get_fotos_for_order(o, folders)
         o["fotos_entrega"] = fotos.get("entrega", [])
         o["no_entregada"] = (o.get("delivery_id") or "").strip() in no_entregadas
     return {"orders": orders}
@@ -2302,9 +3042,10 @@ def api_get_order_by_codigo(codigo: str):
     """Devuelve la orden buscando por código de integración o identificador único; fotos y flags has_entrega_photo, no_entregada. Fotos se buscan en todas las referencias (codigo integración e identificador unico)."""
     order = _find_order_by_codigo(codigo)
     if order:
+        no_entregadas = _get_no_entregadas_set()
         fotos = _get_fotos_for_order(order)
         order["has_entrega_photo"] = _order_has_entrega_photo_from_order(order)
-        order["no_entregada"] = (order.get("delivery_id") or "").strip() in _get_no_entregadas_set()
+        order["no_entregada"] = (order.get("delivery_id") or "").strip() in no_entregadas
     else:
         fotos = _get_fotos_for_codigo(codigo)
     return {"order": order, "fotos": fotos}
@@ -2360,7 +3101,7 @@ class ApelarBody(BaseModel):
 @app.post("/api/apelaciones/marcar")
 def api_marcar_apelacion(body: MarcarApelacionBody):
     """Admin: marca una orden para apelación con el monto que nos descontó el canal."""
-    data = _read_apelaciones()
+    data = _read_apelaciones_for_update()
     cod = (body.codigo or "").strip()
     if not cod:
         raise HTTPException(status_code=400, detail="codigo requerido")
@@ -2370,24 +3111,24 @@ def api_marcar_apelacion(body: MarcarApelacionBody):
     monto_desc = float(body.monto_descontado) if body.monto_descontado is not None else 0
     canal = (body.canal or "").strip()
     # Actualizar si ya existe
-    for item in items:
-        if (item.get("codigo") or "").strip() == cod:
-            item["canal"] = canal
-            item["delivery_id"] = (body.delivery_id or "").strip()
-            item["monto_descontado"] = monto_desc
-            item["fecha_marcado"] = _now().isoformat()
-            item["local"] = local
-            item["fecha"] = fecha
-            _write_apelaciones(data)
-            if local:
-                _create_notificacion(
-                    local=local, tipo="orden_por_apelar",
-                    titulo="Pedido por apelar",
-                    mensaje=f"El pedido #{cod} ({canal}) por {_fmt_monto_notif(monto_desc)} está pendiente de apelación.",
-                    route_name="apelar",
-                    extra={"codigo": cod, "canal": canal, "monto": monto_desc},
-                )
-            return {"ok": True}
+    item = _apelacion_item(data, cod)
+    if item is not None:
+        item["canal"] = canal
+        item["delivery_id"] = (body.delivery_id or "").strip()
+        item["monto_descontado"] = monto_desc
+        item["fecha_marcado"] = _now().isoformat()
+        item["local"] = local
+        item["fecha"] = fecha
+        _write_apelaciones(data)
+        if local:
+            _create_notificacion(
+                local=local, tipo="orden_por_apelar",
+                titulo="Pedido por apelar",
+                mensaje=f"El pedido #{cod} ({canal}) por {_fmt_monto_notif(monto_desc)} está pendiente de apelación.",
+                route_name="apelar",
+                extra={"codigo": cod, "canal": canal, "monto": monto_desc},
+            )
+        return {"ok": True}
     items.append({
         "codigo": cod,
         "canal": canal,
@@ -2422,19 +3163,23 @@ def api_apelaciones_pendientes(
     """Órdenes marcadas para apelación que aún no tienen respuesta (foto + monto_devuelto). Para la vista Apelar del user."""
     config = _get_app_config()
     dias_para_apelar = int(config.get("dias_para_apelar") or 5)
-    apelaciones = _read_apelaciones()
     if (fecha_desde or "").strip() and (fecha_hasta or "").strip():
+        _validate_range(fecha_desde.strip()[:10], fecha_hasta.strip()[:10])
         orders = _get_orders_for_local_date_range(local, fecha_desde.strip()[:10], fecha_hasta.strip()[:10])
     else:
         date_str = (fecha or "").strip()[:10] or _get_today_colombia()
         orders = _get_orders_for_local_date(local, date_str)
-    codigos_marcados = {(item.get("codigo") or "").strip() for item in apelaciones.get("items", [])}
+    # Índice e items del mismo snapshot: por orden basta un dict.get y la posición siempre corresponde al código
+    snap = _apelaciones_snapshot()
+    index = snap["index"]
+    items = snap["data"]["items"]
     pendientes = []
-    for o in orders:
+    for o in orders if index else ():
         cod = (o.get("Codigo integracion") or "").strip()
-        if cod not in codigos_marcados:
+        pos = index.get(cod)
+        if pos is None:
             continue
-        ap = _get_apelacion_by_codigo(cod)
+        ap = items[pos]
         if not ap or ap.get("monto_devuelto") is not None:
             continue  # ya apelada
         if ap.get("descuento_confirmado"):
@@ -2468,14 +3213,13 @@ async def api_apelar(
         raise HTTPException(status_code=404, detail="Orden no marcada para apelación")
     if ap.get("monto_devuelto") is not None:
         raise HTTPException(status_code=400, detail="Esta orden ya fue apelada")
-    data = _read_apelaciones()
+    data = _read_apelaciones_for_update()
     fecha_est = (fecha_estimada_devolucion or "").strip()[:10] or None
-    for item in data.get("items", []):
-        if (item.get("codigo") or "").strip() == cod:
-            item["monto_devuelto"] = float(monto_devuelto)
-            item["fecha_estimada_devolucion"] = fecha_est
-            item["fecha_apelado"] = _now().isoformat()
-            break
+    item = _apelacion_item(data, cod)
+    if item is not None:
+        item["monto_devuelto"] = float(monto_devuelto)
+        item["fecha_estimada_devolucion"] = fecha_est
+        item["fecha_apelado"] = _now().isoformat()
     _write_apelaciones(data)
     # Guardar fotos de la resolución del canal en apelacion/{canal}/
     _ap_local = (ap.get("local") or "").strip()
@@ -2487,8 +3231,7 @@ async def api_apelar(
         for f in files:
             if f.filename:
                 safe_name = _sanitize_path(f.filename) or "file"
-                content = await f.read()
-                (base / safe_name).write_bytes(content)
+                await asyncio.to_thread(_copy_upload, f.file, base / safe_name)
     # Notificar al admin que la sede respondió la apelación
     if _ap_local:
         _create_notificacion(
@@ -2516,37 +3259,39 @@ def api_no_apelar(body: NoApelarBody):
         raise HTTPException(status_code=404, detail="Orden no encontrada en apelaciones")
     if ap.get("monto_devuelto") is not None:
         raise HTTPException(status_code=400, detail="Esta orden ya fue apelada")
-    data = _read_apelaciones()
-    for item in data.get("items", []):
-        if (item.get("codigo") or "").strip() == cod:
-            item["sede_decidio_no_apelar"] = True
-            break
+    data = _read_apelaciones_for_update()
+    item = _apelacion_item(data, cod)
+    if item is not None:
+        item["sede_decidio_no_apelar"] = True
     _write_apelaciones(data)
     return {"ok": True}
 
 
 @app.get("/api/apelaciones/reembolsos-pendientes")
 def api_reembolsos_pendientes(
+    request: Request,
+    response: Response,
     local: str = Query("", description="Filtrar por local"),
     fecha_desde: str = Query("", description="YYYY-MM-DD"),
     fecha_hasta: str = Query("", description="YYYY-MM-DD"),
 ):
     """Órdenes apeladas (con monto_devuelto) que aún no están totalmente reembolsadas (reembolso puede ser incremental)."""
-    apelaciones = _read_apelaciones()
+    not_modified = _apelaciones_not_modified(request, response)
+    if not_modified is not None:
+        return not_modified
     items = [
-        i for i in apelaciones.get("items", [])
+        i for i in _apelaciones_filtradas(local, fecha_desde, fecha_hasta)
         if i.get("monto_devuelto") is not None
         and _total_reembolsado(i) < float(i.get("monto_devuelto") or 0)
     ]
-    if local:
-        items = [i for i in items if (i.get("local") or "").strip() == local.strip()]
-    if fecha_desde:
-        items = [i for i in items if (i.get("fecha") or "") >= fecha_desde]
-    if fecha_hasta:
-        items = [i for i in items if (i.get("fecha") or "") <= fecha_hasta]
-    for i in items:
-        i["total_reembolsado"] = round(_total_reembolsado(i), 2)
-        i["reembolsos"] = i.get("reembolsos") if isinstance(i.get("reembolsos"), list) else []
+    items = [
+        {
+            **i,
+            "total_reembolsado": round(_total_reembolsado(i), 2),
+            "reembolsos": i.get("reembolsos") if isinstance(i.get("reembolsos"), list) else [],
+        }
+        for i in items
+    ]
     items.sort(key=lambda x: (x.get("fecha") or ""), reverse=True)
     return {"items": items}
 
@@ -2578,12 +3323,11 @@ def api_reembolsar(body: ReembolsarBody):
     if monto <= 0:
         raise HTTPException(status_code=400, detail="El monto debe ser mayor a 0")
     fecha = (body.fecha_reembolso or "").strip()[:10] or _now().strftime("%Y-%m-%d")
-    data = _read_apelaciones()
+    data = _read_apelaciones_for_update()
     _local_reemb = ""
     _canal_reemb = ""
-    for item in data.get("items", []):
-        if (item.get("codigo") or "").strip() != cod:
-            continue
+    item = _apelacion_item(data, cod)
+    if item is not None:
         reembolsos = item.get("reembolsos")
         if not isinstance(reembolsos, list):
             reembolsos = []
@@ -2601,7 +3345,6 @@ def api_reembolsar(body: ReembolsarBody):
         item["monto_reembolsado"] = total
         _local_reemb = (item.get("local") or "").strip()
         _canal_reemb = (item.get("canal") or "").strip()
-        break
     _write_apelaciones(data)
     if _local_reemb:
         _create_notificacion(
@@ -2661,31 +3404,19 @@ def _apelacion_plazo_vencido(item: dict, dias_para_apelar: int) -> bool:
 
 @app.get("/api/apelaciones/estado-admin")
 def api_apelaciones_estado_admin(
+    request: Request,
+    response: Response,
     local: str = Query("", description="Filtrar por sede"),
     fecha_desde: str = Query("", description="YYYY-MM-DD"),
     fecha_hasta: str = Query("", description="YYYY-MM-DD"),
 ):
     """Admin: estado de todas las apelaciones (pendiente apelar, apelada, reembolsada, descuento confirmado)."""
-    apelaciones = _read_apelaciones()
+    not_modified = _apelaciones_not_modified(request, response)
+    if not_modified is not None:
+        return not_modified
     items = []
-    for item in apelaciones.get("items", []):
-        if local and (item.get("local") or "").strip() != local.strip():
-            continue
-        if fecha_desde and (item.get("fecha") or "") < fecha_desde:
-            continue
-        if fecha_hasta and (item.get("fecha") or "") > fecha_hasta:
-            continue
-        out = dict(item)
-        perdida = _calcular_perdida(item)
-        total_reemb = _total_reembolsado(item)
-        total_descu = _total_descuentos_sede(item)
-        out["perdida"] = round(perdida, 2)
-        out["total_reembolsado"] = round(total_reemb, 2)
-        out["total_descuentos_sede"] = round(total_descu, 2)
-        out["perdida_restante"] = round(max(0, perdida - total_descu), 2)
-        out["no_reconocido_canal"] = round(
-            max(0.0, float(item.get("monto_descontado") or 0) - float(item.get("monto_devuelto") or 0)), 2
-        )
+    for item in _apelaciones_filtradas(local, fecha_desde, fecha_hasta):
+        perdida, total_reemb, total_descu, _, _ = _apelacion_montos(item)
         # Lista de estados: reembolso, descuento, y siempre mostrar "La sede decidió no apelar" si aplica
         estados = []
         monto_dev = float(item.get("monto_devuelto") or 0)
@@ -2703,11 +3434,23 @@ def api_apelaciones_estado_admin(
                 estados = ["apelada"]
             else:
                 estados = ["pendiente_apelar"]
-        out["reembolsos"] = item.get("reembolsos") if isinstance(item.get("reembolsos"), list) else []
-        out["descuentos"] = item.get("descuentos") if isinstance(item.get("descuentos"), list) else []
-        out["estados"] = estados
-        out["estado"] = estados[-1]  # último para compatibilidad y orden por defecto
-        items.append(out)
+        # Una sola construcción por fila ({**item, ...}) en vez de dict(item) + asignaciones
+        reembolsos = item.get("reembolsos")
+        descuentos = item.get("descuentos")
+        items.append({
+            **item,
+            "perdida": round(perdida, 2),
+            "total_reembolsado": round(total_reemb, 2),
+            "total_descuentos_sede": round(total_descu, 2),
+            "perdida_restante": round(max(0, perdida - total_descu), 2),
+            "no_reconocido_canal": round(
+                max(0.0, float(item.get("monto_descontado") or 0) - float(item.get("monto_devuelto") or 0)), 2
+            ),
+            "reembolsos": reembolsos if isinstance(reembolsos, list) else [],
+            "descuentos": descuentos if isinstance(descuentos, list) else [],
+            "estados": estados,
+            "estado": estados[-1],  # último para compatibilidad y orden por defecto
+        })
     items.sort(key=lambda x: (x.get("fecha") or ""), reverse=True)
     return {"items": items}
 
@@ -2731,18 +3474,12 @@ def api_apelaciones_descuentos(
     """
     config = _get_app_config()
     dias_para_apelar = int(config.get("dias_para_apelar") or 5)
-    apelaciones = _read_apelaciones()
     items = []
-    for item in apelaciones.get("items", []):
-        perdida = _calcular_perdida(item)
+    # Primero los filtros baratos y más selectivos (sede, fechas); la pérdida solo para los que pasan
+    for item in _apelaciones_filtradas(local, fecha_desde, fecha_hasta):
+        perdida, _, total_eje, total_prog, monto_empresa = _apelacion_montos(item)
         if perdida <= 0:
             continue
-        if local and (item.get("local") or "").strip() != local.strip():
-            continue
-        if fecha_desde and (item.get("fecha") or "") < fecha_desde:
-            continue
-        if fecha_hasta and (item.get("fecha") or "") > fecha_hasta:
-            continue
         # Solo incluir si la orden ya está lista para descontar
         vencida = _apelacion_plazo_vencido(item, dias_para_apelar)
         puede_descontar = (
@@ -2752,9 +3489,6 @@ def api_apelaciones_descuentos(
         )
         if not puede_descontar:
             continue
-        total_eje = _total_descuentos_sede(item)
-        total_prog = _total_descuentos_programados(item)
-        monto_empresa = _monto_empresa_asume(item)
         total_cubierto_prog = total_prog + monto_empresa
         total_cubierto_eje = total_eje + monto_empresa
         descuentos_list = item.get("descuentos") if isinstance(item.get("descuentos"), list) else []
@@ -2773,18 +3507,19 @@ def api_apelaciones_descuentos(
                 continue
         elif solo_pendientes and total_cubierto_prog >= perdida:
             continue
-        out = dict(item)
-        out["perdida"] = round(perdida, 2)
-        out["total_descuentos_sede"] = round(total_eje, 2)
-        out["total_programado"] = round(total_prog, 2)
-        out["monto_empresa_asume"] = round(monto_empresa, 2)
-        out["empresa_asume"] = monto_empresa > 0
-        out["fecha_empresa_asume"] = item.get("fecha_empresa_asume", "")
-        out["perdida_restante"] = round(max(0, perdida - total_cubierto_prog), 2)
-        out["perdida_restante_ejecutar"] = round(max(0, perdida - total_cubierto_eje), 2)
-        out["descuentos"] = descuentos_list
-        out["apelacion_vencida"] = vencida
-        items.append(out)
+        items.append({
+            **item,
+            "perdida": round(perdida, 2),
+            "total_descuentos_sede": round(total_eje, 2),
+            "total_programado": round(total_prog, 2),
+            "monto_empresa_asume": round(monto_empresa, 2),
+            "empresa_asume": monto_empresa > 0,
+            "fecha_empresa_asume": item.get("fecha_empresa_asume", ""),
+            "perdida_restante": round(max(0, perdida - total_cubierto_prog), 2),
+            "perdida_restante_ejecutar": round(max(0, perdida - total_cubierto_eje), 2),
+            "descuentos": descuentos_list,
+            "apelacion_vencida": vencida,
+        })
     items.sort(key=lambda x: (x.get("fecha") or ""), reverse=True)
     return {"items": items}
 
@@ -2813,10 +3548,9 @@ def api_confirmar_descuento(body: ConfirmarDescuentoBody):
         raise HTTPException(status_code=400, detail="Indica el monto descontado en esta quincena")
     quincena = (body.quincena or "").strip() or (_now().strftime("%Y-%m") + "-1")
     fecha = (body.fecha or "").strip() or _now().strftime("%Y-%m-%d")
-    data = _read_apelaciones()
-    for item in data.get("items", []):
-        if (item.get("codigo") or "").strip() != cod:
-            continue
+    data = _read_apelaciones_for_update()
+    item = _apelacion_item(data, cod)
+    if item is not None:
         descuentos = item.get("descuentos")
         if not isinstance(descuentos, list):
             descuentos = []
@@ -2835,7 +3569,6 @@ def api_confirmar_descuento(body: ConfirmarDescuentoBody):
         total_eje = sum(float(d.get("monto") or 0) for d in descuentos if isinstance(d, dict) and d.get("ejecutado", True))
         item["descuento_confirmado"] = total_eje >= perdida
         item["fecha_descuento_confirmado"] = fecha
-        break
     _write_apelaciones(data)
     return {"ok": True}
 
@@ -2864,12 +3597,11 @@ def api_programar_descuento(body: ProgramarDescuentoBody):
         raise HTTPException(status_code=400, detail="Indica el monto a programar")
     quincena = (body.quincena or "").strip() or (_now().strftime("%Y-%m") + "-1")
     fecha = (body.fecha or "").strip() or _now().strftime("%Y-%m-%d")
-    data = _read_apelaciones()
+    data = _read_apelaciones_for_update()
     _local_prog = ""
     _canal_prog = ""
-    for item in data.get("items", []):
-        if (item.get("codigo") or "").strip() != cod:
-            continue
+    item = _apelacion_item(data, cod)
+    if item is not None:
         descuentos = item.get("descuentos")
         if not isinstance(descuentos, list):
             descuentos = []
@@ -2877,7 +3609,6 @@ def api_programar_descuento(body: ProgramarDescuentoBody):
         descuentos.append({"id": str(uuid_mod.uuid4()), "monto": monto, "quincena": quincena, "fecha": fecha, "ejecutado": False})
         _local_prog = (item.get("local") or "").strip()
         _canal_prog = (item.get("canal") or "").strip()
-        break
     _write_apelaciones(data)
     if _local_prog:
         _create_notificacion(
@@ -2902,14 +3633,13 @@ def api_ejecutar_descuento(body: EjecutarDescuentoBody):
     did = (body.descuento_id or "").strip()
     if not cod or not did:
         raise HTTPException(status_code=400, detail="codigo y descuento_id requeridos")
-    data = _read_apelaciones()
+    data = _read_apelaciones_for_update()
     found = False
     _local_eje = ""
     _canal_eje = ""
     _monto_eje = 0.0
-    for item in data.get("items", []):
-        if (item.get("codigo") or "").strip() != cod:
-            continue
+    item = _apelacion_item(data, cod)
+    if item is not None:
         descuentos = item.get("descuentos", [])
         for d in descuentos:
             if isinstance(d, dict) and d.get("id") == did:
@@ -2924,7 +3654,6 @@ def api_ejecutar_descuento(body: EjecutarDescuentoBody):
             _local_eje = (item.get("local") or "").strip()
             _canal_eje = (item.get("canal") or "").strip()
             _monto_eje = next((float(d.get("monto") or 0) for d in descuentos if isinstance(d, dict) and d.get("id") == did), 0)
-            break
     if not found:
         raise HTTPException(status_code=404, detail="Descuento programado no encontrado")
     _write_apelaciones(data)
@@ -2956,10 +3685,9 @@ def api_asumir_empresa(body: AsumirEmpresaBody):
     perdida = _calcular_perdida(ap)
     if perdida <= 0:
         raise HTTPException(status_code=400, detail="Esta orden no tiene pérdida")
-    data = _read_apelaciones()
-    for item in data.get("items", []):
-        if (item.get("codigo") or "").strip() != cod:
-            continue
+    data = _read_apelaciones_for_update()
+    item = _apelacion_item(data, cod)
+    if item is not None:
         total_prog = _total_descuentos_programados(item)
         monto_ya = _monto_empresa_asume(item)
         restante = max(0.0, perdida - total_prog - monto_ya)
@@ -2976,7 +3704,6 @@ def api_asumir_empresa(body: AsumirEmpresaBody):
         total_eje = _total_descuentos_sede(item)
         if total_eje + nuevo_total >= perdida:
             item["descuento_confirmado"] = True
-        break
     _write_apelaciones(data)
     return {"ok": True}
 
@@ -2987,17 +3714,15 @@ def api_deshacer_empresa_asume(body: AsumirEmpresaBody):
     cod = (body.codigo or "").strip()
     if not cod:
         raise HTTPException(status_code=400, detail="codigo requerido")
-    data = _read_apelaciones()
-    for item in data.get("items", []):
-        if (item.get("codigo") or "").strip() != cod:
-            continue
+    data = _read_apelaciones_for_update()
+    item = _apelacion_item(data, cod)
+    if item is not None:
         item["monto_empresa_asume"] = 0
         item["empresa_asume"] = False
         item["fecha_empresa_asume"] = ""
         perdida = _calcular_perdida(item)
         total_eje = _total_descuentos_sede(item)
         item["descuento_confirmado"] = total_eje >= perdida
-        break
     _write_apelaciones(data)
     return {"ok": True}
 
@@ -3007,25 +3732,35 @@ def api_informes(
     fecha_desde: str = Query(..., description="YYYY-MM-DD"),
     fecha_hasta: str = Query(..., description="YYYY-MM-DD"),
     local: list[str] = Query(default=[], description="Filtrar por sede(s)"),
+    solo_apelaciones: bool = Query(False, description="Omitir el conteo de órdenes (no recorre la cache de deliverys)"),
 ):
     """Métricas y series para la sección Reportes: órdenes, apelaciones, reembolsos, pérdida por día/sede/canal."""
     desde = (fecha_desde or "").strip()[:10]
     hasta = (fecha_hasta or "").strip()[:10]
     if not desde or not hasta:
         raise HTTPException(status_code=400, detail="fecha_desde y fecha_hasta requeridos (YYYY-MM-DD)")
+    _validate_range(desde, hasta)
     from collections import defaultdict
 
     today_str = datetime.now().strftime("%Y-%m-%d")
     locales_filter: set[str] = {l.strip() for l in local if l.strip()}
 
+    # Apelaciones en rango: totales y por día/sede/canal
+    items_ap = [
+        i for i, _, loc, fecha in _apelaciones_norm()
+        if desde <= fecha <= hasta and (not locales_filter or loc in locales_filter)
+    ]
+
     # Órdenes por día, sede y canal (desde cache deliverys)
     ordenes_por_dia: dict[str, int] = defaultdict(int)
     ordenes_por_sede: dict[str, int] = defaultdict(int)
     ordenes_por_canal: dict[str, int] = defaultdict(int)
-    locales_data = _locales_list_for_iteration()
+    # Con solo_apelaciones no se recorre la cache: los conteos de órdenes quedan en 0
+    locales_data = [] if solo_apelaciones else _locales_list_for_iteration()
+    dates = _date_strs_in_range(desde, hasta)
     total_ordenes = 0
     for item in locales_data:
-        local_id = _locale_id(item) if isinstance(item, dict) else ""
+        local_id = _locale_id(item)
         local_name = _locale_name(item)
         if not local_id:
             continue
@@ -3034,30 +3769,17 @@ def api_informes(
         local_dir = DELIVERYS_CACHE_DIR / local_id
         if not local_dir.is_dir():
             continue
-        for json_file in sorted(local_dir.glob("*.json")):
-            date_str = json_file.stem
-            if date_str < desde or date_str > hasta:
+        for date_str, json_file in _deliverys_files_in_range(local_dir, desde, hasta, dates):
+            # Se acumula por archivo (día) con los conteos por canal ya calculados, no fila por fila
+            por_canal = _orders_por_canal_for_file(json_file)
+            if not por_canal:
                 continue
-            cached = _read_json(json_file, {})
-            data = cached.get("data") if isinstance(cached.get("data"), list) else []
-            for row in data:
-                order = _delivery_row_to_order(row)
-                cod = (order.get("Codigo integracion") or "").strip()
-                if not cod or cod == "—":
-                    continue
-                total_ordenes += 1
-                ordenes_por_dia[date_str] += 1
-                ordenes_por_sede[local_name] += 1
-                canal = (order.get("Canal de delivery") or "").strip() or "—"
-                ordenes_por_canal[canal] += 1
-
-    # Apelaciones en rango: totales y por día/sede/canal
-    apelaciones = _read_apelaciones()
-    items_ap = [
-        i for i in apelaciones.get("items", [])
-        if (i.get("fecha") or "") >= desde and (i.get("fecha") or "") <= hasta
-        and (not locales_filter or (i.get("local") or "").strip() in locales_filter)
-    ]
+            n = sum(por_canal.values())
+            total_ordenes += n
+            ordenes_por_dia[date_str] += n
+            ordenes_por_sede[local_name] += n
+            for canal, c in por_canal.items():
+                ordenes_por_canal[canal] += c
 
     apelaciones_por_dia: dict[str, int] = defaultdict(int)
     apelaciones_por_sede: dict[str, int] = defaultdict(int)
@@ -3101,7 +3823,7 @@ def api_informes(
         apelaciones_por_dia[f] += 1
         apelaciones_por_sede[loc] += 1
         apelaciones_por_canal[can] += 1
-        perd = _calcular_perdida(i)
+        perd, total_reemb, descu_ejecutados, _, empresa_asume = _apelacion_montos(i)
         perdida_por_dia[f] += perd
         perdida_por_sede[loc] += perd
         perdida_por_canal[can] += perd
@@ -3113,8 +3835,6 @@ def api_informes(
         if i.get("monto_devuelto") is not None:
             total_devuelto += monto_dev
 
-        total_reemb = _total_reembolsado(i)
-
         # Estado apelación
         is_sede_no_apelar = bool(i.get("sede_decidio_no_apelar"))
         is_apelada = bool(i.get("fecha_apelado")) and not is_sede_no_apelar
@@ -3150,11 +3870,9 @@ def api_informes(
             sede_reembolso_retraso[loc] += 1
 
         # Descuento a sede
-        empresa_asume = float(i.get("monto_empresa_asume") or 0)
         total_empresa_asume += empresa_asume
         sede_empresa_asume[loc] += empresa_asume
 
-        descu_ejecutados = _total_descuentos_sede(i)
         total_descuentos_sede += descu_ejecutados
 
         perd_restante = float(i.get("perdida_restante") or perd)
@@ -3194,7 +3912,8 @@ def api_informes(
         })
         d += timedelta(days=1)
 
-    all_sedes = sorted(set(ordenes_por_sede) | set(apelaciones_por_sede))
+    # Sin apelaciones en rango las claves son solo las de órdenes: no hace falta unir conjuntos
+    all_sedes = sorted(set(ordenes_por_sede) | set(apelaciones_por_sede)) if items_ap else sorted(ordenes_por_sede)
     por_sede = []
     for loc in all_sedes:
         ords = ordenes_por_sede.get(loc, 0)
@@ -3223,7 +3942,7 @@ def api_informes(
             "apelaciones": apelaciones_por_canal.get(can, 0),
             "perdida": round(perdida_por_canal.get(can, 0), 2),
         }
-        for can in sorted(set(ordenes_por_canal) | set(apelaciones_por_canal))
+        for can in (sorted(set(ordenes_por_canal) | set(apelaciones_por_canal)) if items_ap else sorted(ordenes_por_canal))
     ]
 
     return {
@@ -3259,21 +3978,24 @@ def api_informes(
 
 @app.get("/api/apelaciones/reporte")
 def api_apelaciones_reporte(
+    request: Request,
+    response: Response,
     local: str = Query("", description="Filtrar por local"),
     fecha_desde: str = Query("", description="YYYY-MM-DD"),
     fecha_hasta: str = Query("", description="YYYY-MM-DD"),
 ):
     """Reporte: total descontado, devuelto y perdido."""
-    apelaciones = _read_apelaciones()
-    items = apelaciones.get("items", [])
-    if local:
-        items = [i for i in items if (i.get("local") or "").strip() == local.strip()]
-    if fecha_desde:
-        items = [i for i in items if (i.get("fecha") or "") >= fecha_desde]
-    if fecha_hasta:
-        items = [i for i in items if (i.get("fecha") or "") <= fecha_hasta]
-    total_descontado = sum(float(item.get("monto_descontado") or 0) for item in items)
-    total_devuelto = sum(float(item.get("monto_devuelto") or 0) for item in items if item.get("monto_devuelto") is not None)
+    not_modified = _apelaciones_not_modified(request, response)
+    if not_modified is not None:
+        return not_modified
+    items = _apelaciones_filtradas(local, fecha_desde, fecha_hasta)
+    # Una sola pasada para ambos totales
+    total_descontado = total_devuelto = 0.0
+    for item in items:
+        total_descontado += float(item.get("monto_descontado") or 0)
+        monto_devuelto = item.get("monto_devuelto")
+        if monto_devuelto is not None:
+            total_devuelto += float(monto_devuelto or 0)
     total_perdido = total_descontado - total_devuelto
     return {
         "total_descontado": round(total_descontado, 2),
@@ -3283,126 +4005,159 @@ def api_apelaciones_reporte(
     }
 
 
-def _build_reporte_rows(
-    local: str = "",
-    locales_filter: list[str] | None = None,
-    fecha_desde: str = "",
-    fecha_hasta: str = "",
-    filter_val: str = "",
-) -> list[dict]:
-    """Construye la lista completa de filas del reporte maestro (sin paginar)."""
-    desde = (fecha_desde or "").strip()[:10]
-    hasta = (fecha_hasta or "").strip()[:10]
-    # Normalize multi-sede filter: combine legacy single `local` with new list
-    _locales_set: set[str] = set()
-    if locales_filter:
-        _locales_set = {l.strip() for l in locales_filter if l.strip()}
-    elif local and local.strip():
-        _locales_set = {local.strip()}
-    locales_data = _locales_list_for_iteration()
-    apelaciones = _read_apelaciones()
-    apelaciones_by_cod = {(a.get("codigo") or "").strip(): a for a in apelaciones.get("items", []) if (a.get("codigo") or "").strip()}
-    rows_list: list[dict] = []
-    for item in locales_data:
-        local_id = _locale_id(item) if isinstance(item, dict) else ""
+def _reporte_row(local_name: str, date_str: str, cod: str, order: dict, ap: dict | None, folders: set[str] | None) -> dict:
+    """Fila completa del reporte maestro para una orden (fotos y estado de apelación)."""
+    fotos = _get_fotos_for_order(order, folders)
+    if ap:
+        perdida, total_reemb, total_descu, total_prog, monto_empresa = _apelacion_montos(ap)
+        perdida = round(perdida, 2)
+    else:
+        perdida = total_reemb = total_descu = total_prog = monto_empresa = 0
+    perdida_restante = round(max(0, perdida - total_prog - monto_empresa), 2) if ap else 0
+    perdida_restante_ejecutar = round(max(0, perdida - total_descu - monto_empresa), 2) if ap else 0
+    no_reconocido_canal = round(
+        max(0.0, float(ap.get("monto_descontado") or 0) - float(ap.get("monto_devuelto") or 0)), 2
+    ) if ap else 0
+    estados_apel: list[str] = []
+    if ap:
+        monto_dev = float(ap.get("monto_devuelto") or 0)
+        if monto_dev > 0 and total_reemb >= monto_dev:
+            estados_apel.append("reembolsada")
+        elif monto_dev > 0:
+            estados_apel.append("apelada")
+        if total_descu >= perdida and perdida > 0:
+            estados_apel.append("descuento_confirmado")
+        if ap.get("sede_decidio_no_apelar"):
+            estados_apel.append("sede_decidio_no_apelar")
+        if not estados_apel:
+            if monto_dev > 0:
+                estados_apel = ["apelada"]
+            else:
+                estados_apel = ["pendiente_apelar"]
+    return {
+        "local": local_name,
+        "fecha": date_str,
+        "codigo": cod,
+        "canal": order.get("Canal de delivery"),
+        "cliente": order.get("Cliente"),
+        "monto_pagado": order.get("Monto pagado"),
+        "hora": order.get("Hora"),
+        "delivery_id": order.get("delivery_id"),
+        "has_entrega_photo": _order_has_entrega_photo_from_order(order, folders),
+        "fotos_entrega": fotos.get("entrega", []),
+        "fotos_apelacion": fotos.get("apelacion", {}),
+        "apelacion": {
+            "monto_descontado": ap.get("monto_descontado"),
+            "monto_devuelto": ap.get("monto_devuelto"),
+            "monto_reembolsado": round(total_reemb, 2),
+            "fecha_apelado": ap.get("fecha_apelado"),
+            "fecha_estimada_devolucion": ap.get("fecha_estimada_devolucion"),
+            "reembolsado": total_reemb >= float(ap.get("monto_devuelto") or 0) if ap.get("monto_devuelto") is not None else ap.get("reembolsado"),
+            "fecha_reembolso": ap.get("fecha_reembolso"),
+            "reembolsos": ap.get("reembolsos") if isinstance(ap.get("reembolsos"), list) else [],
+            "descuento_confirmado": total_descu >= perdida and perdida > 0,
+            "fecha_descuento_confirmado": ap.get("fecha_descuento_confirmado"),
+            "descuentos": ap.get("descuentos") if isinstance(ap.get("descuentos"), list) else [],
+            "total_descuentos_sede": round(total_descu, 2),
+            "total_programado": round(total_prog, 2),
+            "perdida_restante": perdida_restante,
+            "perdida_restante_ejecutar": perdida_restante_ejecutar,
+            "monto_empresa_asume": round(monto_empresa, 2),
+            "empresa_asume": monto_empresa > 0,
+            "fecha_empresa_asume": ap.get("fecha_empresa_asume"),
+            "fecha_marcado": ap.get("fecha_marcado"),
+            "sede_decidio_no_apelar": ap.get("sede_decidio_no_apelar"),
+        } if ap else None,
+        "estados_apelacion": estados_apel,
+        "estado_apelacion": estados_apel[-1] if estados_apel else "",
+        "perdida": perdida,
+        "no_reconocido_canal": no_reconocido_canal,
+    }
+
+
+def _reporte_candidates(
+    locales_set: set[str], desde: str, hasta: str, filter_val: str
+) -> list[tuple[str, str, str, dict]]:
+    """
+    (fecha, local, código, orden) de cada orden del reporte, ya filtradas por texto y ordenadas por
+    (fecha, local, código). Liviano: las fotos y la apelación se resuelven solo al armar las filas.
+    """
+    dates = _date_strs_in_range(desde, hasta)
+    fv = (filter_val or "").strip().lower()
+    out: list[tuple[str, str, str, dict]] = []
+    for item in _locales_list_for_iteration():
+        local_id = _locale_id(item)
         local_name = _locale_name(item)
         if not local_id:
             continue
-        if _locales_set and local_name not in _locales_set:
+        if locales_set and local_name not in locales_set:
             continue
         local_dir = DELIVERYS_CACHE_DIR / local_id
         if not local_dir.is_dir():
             continue
-        for json_file in sorted(local_dir.glob("*.json")):
-            date_str = json_file.stem
-            if date_str < desde or date_str > hasta:
-                continue
-            cached = _read_json(json_file, {})
-            data = cached.get("data") if isinstance(cached.get("data"), list) else []
-            for row in data:
-                order = _delivery_row_to_order(row)
+        local_match = bool(fv) and fv in local_name.lower()
+        for date_str, json_file in _deliverys_files_in_range(local_dir, desde, hasta, dates):
+            for order in _orders_for_file(json_file):
                 cod = (order.get("Codigo integracion") or "").strip()
                 if not cod or cod == "—":
                     continue
-                ap = apelaciones_by_cod.get(cod)
-                fotos = _get_fotos_for_order(order)
-                perdida = round(_calcular_perdida(ap), 2) if ap else 0
-                total_reemb = _total_reembolsado(ap) if ap else 0
-                total_descu = _total_descuentos_sede(ap) if ap else 0
-                total_prog = _total_descuentos_programados(ap) if ap else 0
-                monto_empresa = _monto_empresa_asume(ap) if ap else 0
-                perdida_restante = round(max(0, perdida - total_prog - monto_empresa), 2) if ap else 0
-                perdida_restante_ejecutar = round(max(0, perdida - total_descu - monto_empresa), 2) if ap else 0
-                no_reconocido_canal = round(
-                    max(0.0, float(ap.get("monto_descontado") or 0) - float(ap.get("monto_devuelto") or 0)), 2
-                ) if ap else 0
-                estados_apel: list[str] = []
-                if ap:
-                    monto_dev = float(ap.get("monto_devuelto") or 0)
-                    if monto_dev > 0 and total_reemb >= monto_dev:
-                        estados_apel.append("reembolsada")
-                    elif monto_dev > 0:
-                        estados_apel.append("apelada")
-                    if total_descu >= perdida and perdida > 0:
-                        estados_apel.append("descuento_confirmado")
-                    if ap.get("sede_decidio_no_apelar"):
-                        estados_apel.append("sede_decidio_no_apelar")
-                    if not estados_apel:
-                        if monto_dev > 0:
-                            estados_apel = ["apelada"]
-                        else:
-                            estados_apel = ["pendiente_apelar"]
-                r = {
-                    "local": local_name,
-                    "fecha": date_str,
-                    "codigo": cod,
-                    "canal": order.get("Canal de delivery"),
-                    "cliente": order.get("Cliente"),
-                    "monto_pagado": order.get("Monto pagado"),
-                    "hora": order.get("Hora"),
-                    "delivery_id": order.get("delivery_id"),
-                    "has_entrega_photo": _order_has_entrega_photo_from_order(order),
-                    "fotos_entrega": fotos.get("entrega", []),
-                    "fotos_apelacion": fotos.get("apelacion", {}),
-                    "apelacion": {
-                        "monto_descontado": ap.get("monto_descontado"),
-                        "monto_devuelto": ap.get("monto_devuelto"),
-                        "monto_reembolsado": round(total_reemb, 2),
-                        "fecha_apelado": ap.get("fecha_apelado"),
-                        "fecha_estimada_devolucion": ap.get("fecha_estimada_devolucion"),
-                        "reembolsado": total_reemb >= float(ap.get("monto_devuelto") or 0) if ap.get("monto_devuelto") is not None else ap.get("reembolsado"),
-                        "fecha_reembolso": ap.get("fecha_reembolso"),
-                        "reembolsos": ap.get("reembolsos") if isinstance(ap.get("reembolsos"), list) else [],
-                        "descuento_confirmado": total_descu >= perdida and perdida > 0,
-                        "fecha_descuento_confirmado": ap.get("fecha_descuento_confirmado"),
-                        "descuentos": ap.get("descuentos") if isinstance(ap.get("descuentos"), list) else [],
-                        "total_descuentos_sede": round(total_descu, 2),
-                        "total_programado": round(total_prog, 2),
-                        "perdida_restante": perdida_restante,
-                        "perdida_restante_ejecutar": perdida_restante_ejecutar,
-                        "monto_empresa_asume": round(monto_empresa, 2),
-                        "empresa_asume": monto_empresa > 0,
-                        "fecha_empresa_asume": ap.get("fecha_empresa_asume"),
-                        "fecha_marcado": ap.get("fecha_marcado"),
-                        "sede_decidio_no_apelar": ap.get("sede_decidio_no_apelar"),
-                    } if ap else None,
-                    "estados_apelacion": estados_apel,
-                    "estado_apelacion": estados_apel[-1] if estados_apel else "",
-                    "perdida": perdida,
-                    "no_reconocido_canal": no_reconocido_canal,
-                }
-                rows_list.append(r)
-    rows_list.sort(key=lambda x: (x.get("fecha") or "", x.get("local") or "", x.get("codigo") or ""))
-    fv = (filter_val or "").strip().lower()
-    if fv:
-        rows_list = [
-            r for r in rows_list
-            if fv in (r.get("local") or "").lower()
-            or fv in (r.get("codigo") or "").lower()
-            or fv in (r.get("canal") or "").lower()
-            or fv in (r.get("cliente") or "").lower()
-        ]
-    return rows_list
+                if fv and not (
+                    local_match
+                    or fv in cod.lower()
+                    or fv in (order.get("Canal de delivery") or "").lower()
+                    or fv in (order.get("Cliente") or "").lower()
+                ):
+                    continue
+                out.append((date_str, local_name, cod, order))
+    out.sort(key=lambda c: (c[0], c[1], c[2]))
+    return out
+
+
+def _reporte_locales_set(local: str, locales_filter: list[str] | None) -> set[str]:
+    # Filtro multi-sede: combina el `local` legacy con la lista nueva
+    if locales_filter:
+        return {l.strip() for l in locales_filter if l.strip()}
+    if local and local.strip():
+        return {local.strip()}
+    return set()
+
+
+def _build_reporte_rows(
+    local: str = "",
+    locales_filter: list[str] | None = None,
+    fecha_desde: str = "",
+    fecha_hasta: str = "",
+    filter_val: str = "",
+    first: int = 0,
+    limit: int | None = None,
+) -> tuple[list[dict], int]:
+    """
+    Filas del reporte maestro y total de registros. Con limit solo se arman (fotos, apelación) las filas
+    de la página [first, first + limit); sin limit, todas.
+    """
+    desde = (fecha_desde or "").strip()[:10]
+    hasta = (fecha_hasta or "").strip()[:10]
+    candidates = _reporte_candidates(_reporte_locales_set(local, locales_filter), desde, hasta, filter_val)
+    total = len(candidates)
+    if limit is not None:
+        candidates = candidates[first: first + limit]
+    if not candidates:
+        return [], total
+    apelaciones_by_cod = {cod: a for a, cod, _, _ in _apelaciones_norm() if cod}
+    folders = _uploads_folder_names()
+
+    def build(candidate: tuple) -> dict:
+        date_str, local_name, cod, order = candidate
+        return _reporte_row(local_name, date_str, cod, order, apelaciones_by_cod.get(cod), folders)
+
+    if len(candidates) == 1:
+        return [build(candidates[0])], total
+    # Las fotos de cada fila son lecturas de carpetas en uploads/: en paralelo, map conserva el orden
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=min(8, len(candidates))) as pool:
+        rows_list = list(pool.map(build, candidates))
+    return rows_list, total
 
 
 @app.get("/api/reporte-maestro")
@@ -3419,9 +4174,11 @@ def api_reporte_maestro(
     hasta = (fecha_hasta or "").strip()[:10]
     if not desde or not hasta:
         raise HTTPException(status_code=400, detail="fecha_desde y fecha_hasta requeridos (YYYY-MM-DD)")
-    rows_list = _build_reporte_rows(locales_filter=local, fecha_desde=desde, fecha_hasta=hasta, filter_val=filter)
-    total_records = len(rows_list)
-    page = rows_list[first: first + rows]
+    _validate_range(desde, hasta)
+    # Solo se arman completas (fotos, apelación) las filas de la página pedida
+    page, total_records = _build_reporte_rows(
+        locales_filter=local, fecha_desde=desde, fecha_hasta=hasta, filter_val=filter, first=first, limit=rows
+    )
     return {"rows": page, "totalRecords": total_records}
 
 
@@ -3448,8 +4205,9 @@ def api_reporte_maestro_excel(
     hasta = (fecha_hasta or "").strip()[:10]
     if not desde or not hasta:
         raise HTTPException(status_code=400, detail="fecha_desde y fecha_hasta requeridos (YYYY-MM-DD)")
+    _validate_range(desde, hasta)
 
-    all_rows = _build_reporte_rows(locales_filter=local, fecha_desde=desde, fecha_hasta=hasta, filter_val=filter)
+    all_rows, _ = _build_reporte_rows(locales_filter=local, fecha_desde=desde, fecha_hasta=hasta, filter_val=filter)
     base_url = str(request.base_url).rstrip("/")
 
     ESTADO_LABELS: dict[str, str] = {
@@ -3704,15 +4462,12 @@ async def api_upload_fotos(
     for f in files:
         if not f.filename:
             continue
-        content = await f.read()
-        if len(content) > max_file_size:
+        safe_name = _sanitize_path(f.filename) or "file"
+        if not await asyncio.to_thread(_copy_upload, f.file, base / safe_name, max_file_size):
             raise HTTPException(
                 status_code=413,
                 detail=f"Archivo '{f.filename}' demasiado grande. Máximo 50 MB por imagen.",
             )
-        safe_name = _sanitize_path(f.filename) or "file"
-        path = base / safe_name
-        path.write_bytes(content)
         saved.append(safe_name)
     if group == "entrega" and saved:
         order = _find_order_by_codigo(codigo)
@@ -3744,21 +4499,44 @@ def _foto_path(codigo: str, group: str, path_rest: str) -> Path:
     return base / group / path_rest
 
 
+@lru_cache(maxsize=64)
+def _foto_media_type(suffix: str) -> str:
+    """Tipo MIME por extensión (una consulta a mimetypes por extensión, no por petición)."""
+    return mimetypes.guess_type(f"foto{suffix}")[0] or "application/octet-stream"
+
+
+def _foto_stat(path: Path) -> os.stat_result:
+    """Un solo stat: 404 si no existe o no es un archivo regular. El resultado se reutiliza en FileResponse."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        raise HTTPException(status_code=404, detail="Archivo no encontrado")
+    if not stat_mod.S_ISREG(st.st_mode):
+        raise HTTPException(status_code=404, detail="Archivo no encontrado")
+    return st
+
+
 @app.get("/api/orders/{codigo:path}/fotos/{group}/{path_rest:path}")
-def api_serve_foto(codigo: str, group: str, path_rest: str):
-    """Sirve un archivo de foto. path_rest = filename (entrega) o canal/filename (apelacion)."""
+def api_serve_foto(codigo: str, group: str, path_rest: str, request: Request):
+    """
+    Sirve un archivo de foto. path_rest = filename (entrega) o canal/filename (apelacion).
+    Con ETag (mtime + tamaño): si el cliente ya la tiene responde 304 sin leer el archivo. No se marca como
+    immutable porque subir otra foto con el mismo nombre reemplaza el archivo en la misma URL.
+    """
     path = _foto_path(codigo, group, path_rest)
-    if not path.exists() or not path.is_file():
-        raise HTTPException(status_code=404, detail="Archivo no encontrado")
-    return FileResponse(path)
+    st = _foto_stat(path)
+    etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag in (request.headers.get("if-none-match") or ""):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, stat_result=st, headers=headers, media_type=_foto_media_type(path.suffix.lower()))
 
 
 @app.delete("/api/orders/{codigo:path}/fotos/{group}/{path_rest:path}")
 def api_delete_foto(codigo: str, group: str, path_rest: str):
     """Elimina un archivo de foto de la orden."""
     path = _foto_path(codigo, group, path_rest)
-    if not path.exists() or not path.is_file():
-        raise HTTPException(status_code=404, detail="Archivo no encontrado")
+    _foto_stat(path)
     path.unlink()
     return {"deleted": path_rest}
 
@@ -3774,6 +4552,14 @@ def api_organize_foto_refs():
     return result
 
 
+async def _report_status_broadcast_loop() -> None:
+    """Cada segundo arma el estado una sola vez y lo envía a todos los clientes de /report/ws."""
+    while True:
+        await asyncio.sleep(1)
+        if _report_ws_clients:
+            await _ws_broadcast(_report_ws_clients, _report_status_payload())
+
+
 def _report_status_payload() -> dict:
     """Construye el objeto de estado para el WebSocket (datos desde API deliverys cada 5 min)."""
     state = _deliverys_scheduler_state
@@ -3869,17 +4655,15 @@ async def api_planilla_upload(
             status_code=400,
             detail=f"Extensión no permitida: {ext}. Usa {', '.join(sorted(_PLANILLA_ALLOWED_EXTENSIONS))}",
         )
-    content = await file.read()
     max_size = 50 * 1024 * 1024  # 50 MB
-    if len(content) > max_size:
-        raise HTTPException(status_code=413, detail="Archivo demasiado grande (máx. 50 MB)")
 
     d = _planilla_dir(local_id, fecha)
     d.mkdir(parents=True, exist_ok=True)
 
     safe_name = _sanitize_path(file.filename) or "planilla" + ext
     dest = d / safe_name
-    dest.write_bytes(content)
+    if not await asyncio.to_thread(_copy_upload, file.file, dest, max_size):
+        raise HTTPException(status_code=413, detail="Archivo demasiado grande (máx. 50 MB)")
     # Notificar al admin que una sede subió planilla
     _create_notificacion(
         local=ADMIN_NOTIF_LOCAL, tipo="planilla_subida",
@@ -3953,17 +4737,16 @@ async def report_status_websocket(websocket: WebSocket):
     cuándo se llamó el reporte y cuándo estará listo/siguiente consulta.
     """
     await websocket.accept()
-    _report_ws_clients.append(websocket)
+    _report_ws_clients.add(websocket)
     try:
+        # Estado inicial ya; los siguientes los envía _report_status_broadcast_loop a todos a la vez
+        await websocket.send_text(_ws_message(_report_status_payload()))
         while True:
-            payload = _report_status_payload()
-            await websocket.send_json(payload)
-            await asyncio.sleep(1)
+            await websocket.receive_text()
     except WebSocketDisconnect:
         pass
     finally:
-        if websocket in _report_ws_clients:
-            _report_ws_clients.remove(websocket)
+        _report_ws_clients.discard(websocket)
 
 
 # ── Configuración global de la app (endpoints) ────────────────────────────────
@@ -4094,13 +4877,13 @@ async def ws_notificaciones(websocket: WebSocket, sede: str = Query(...)):
         data = _read_notificaciones()
         pending = [i for i in data.get("items", []) if i.get("local") == sede_name and not i.get("leida")]
         if pending:
-            await websocket.send_json({"type": "initial", "items": pending})
+            await websocket.send_text(_ws_message({"type": "initial", "items": pending}))
         while True:
             try:
                 notif = await asyncio.wait_for(q.get(), timeout=25)
-                await websocket.send_json({"type": "notificacion", "data": notif})
+                await websocket.send_text(_ws_message({"type": "notificacion", "data": notif}))
             except asyncio.TimeoutError:
-                await websocket.send_json({"type": "ping"})
+                await websocket.send_text(_WS_PING)
     except WebSocketDisconnect:
         pass
     except Exception:
@@ -7,41 +7,71 @@ Opcional: app.state.didi_capture_maps_dir = Path("/ruta/carpeta") para guardar l
 from __future__ import annotations
 
 import asyncio
+import atexit
 import json
+import os
+import threading
 import time
 from datetime import datetime
+from itertools import chain
 from pathlib import Path
 
 from fastapi import APIRouter, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, Response
 
 try:
     from zoneinfo import ZoneInfo
 except ImportError:
     ZoneInfo = None
 
+try:
+    import orjson
+    from orjson import loads as _loads  # parsea bytes directamente
+except ImportError:
+    orjson = None  # type: ignore
+    _loads = json.loads
+
 _DEFAULT_MAPS_DIR = Path(__file__).resolve().parent / "maps"
 
 # Sedes Didi: extensión envía heartbeat cada ~30 s; si no llega en 36 s se marca desconectada (no se quita de la lista)
 _DIDI_STALE_SECONDS = 36
+# Un cliente WebSocket que tarda más que esto en aceptar un envío se da por muerto
+_DIDI_WS_SEND_TIMEOUT = 5.0
 _didi_sedes: dict[str, dict] = {}  # shopId -> { "last_seen": unix_ts, "data": dict }; las sedes no se eliminan
-_didi_ws_clients: list[WebSocket] = []
+_didi_ws_clients: set[WebSocket] = set()
 # Blacklist: shopId en este archivo no se muestran ni conectadas ni desconectadas
 _DIDI_BLACKLIST_PATH = Path(__file__).resolve().parent.parent / "reports" / "didi" / "sedes_blacklist.json"
 # Mapa restaurant_id <-> didi shopId (reports/didi/mapa_restaurant_didi.json)
 _DIDI_MAPA_PATH = Path(__file__).resolve().parent.parent / "reports" / "didi" / "mapa_restaurant_didi.json"
 # Persistencia: sedes que han enviado al menos un heartbeat (no se pierden al reiniciar)
 _DIDI_PERSISTENT_PATH = Path(__file__).resolve().parent.parent / "reports" / "didi" / "sedes_heartbeats_persistent.json"
+# El heartbeat solo marca sucio; el prune loop (cada 5 s) y la salida del proceso escriben el archivo una vez
+_didi_persistent_dirty = False
+# Blacklist y mapa ya parseados, por (mtime_ns, size): cada heartbeat y cada broadcast los consulta
+_didi_blacklist_cache: dict = {"key": None, "value": None}
+_didi_mapa_cache: dict = {"key": None, "value": None}
+# Mapas didi_restaurant_map_YYYY-MM-DD.json ya cargados: path -> ((mtime_ns, size), {orderId: displayNum})
+_didi_maps_cache: dict[Path, tuple] = {}
+# _update_map corre en un hilo: dos dailyOrders a la vez no deben pisarse el merge del mismo mapa
+_didi_maps_lock = threading.Lock()
+# /didi/mapa-restaurant: JSON ya serializado del mapa, válido mientras no cambie el archivo (mtime_ns, size)
+_didi_mapa_response_cache: dict = {"key": None, "body": None}
 
 router = APIRouter()
 
 
+# Zona horaria Colombia resuelta una vez (None si zoneinfo/tzdata no están disponibles)
+_COLOMBIA_TZ = None
+if ZoneInfo:
+    try:
+        _COLOMBIA_TZ = ZoneInfo("America/Bogota")
+    except Exception:
+        pass
+
+
 def _now_colombia() -> datetime:
-    if ZoneInfo:
-        try:
-            return datetime.now(ZoneInfo("America/Bogota"))
-        except Exception:
-            pass
+    if _COLOMBIA_TZ:
+        return datetime.now(_COLOMBIA_TZ)
     return datetime.utcnow()
 
 
@@ -51,32 +81,94 @@ def _maps_dir(request: Request) -> Path:
 
 def _extract_order_id_to_display(body: dict) -> dict[str, str]:
     out = {}
-    data = body.get("data") or {}
-    for order in (data.get("serving") or []) + (data.get("highlight") or []):
+    data = body.get("data")
+    if not isinstance(data, dict):
+        return out
+    for order in chain(data.get("serving") or (), data.get("highlight") or ()):
         if not isinstance(order, dict):
             continue
-        oid = str(order.get("orderId") or "").strip()
-        display = (order.get("displayNum") or "").strip()
+        get = order.get
+        display = get("displayNum")
+        if not display:
+            continue
+        oid = str(get("orderId") or "").strip()
+        display = display.strip()
         if oid and display:
             out[oid] = display
     return out
 
 
+def _stat_key(path: Path) -> tuple[int, int] | None:
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def _json_bytes(data) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _write_json_atomic(path: Path, data: dict, indent: bool = True) -> None:
+    """Escribe el JSON en un temporal y lo renombra, para que el merge nunca lea un mapa a medio escribir."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # pid + hilo: el estado de heartbeats se escribe desde un hilo mientras el event loop escribe mapas
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    if not indent:
+        raw = _json_bytes(data)
+    elif orjson is not None:
+        raw = orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    else:
+        raw = json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8")
+    try:
+        with tmp.open("wb") as f:
+            f.write(raw)
+            f.flush()
+            # Si el equipo se apaga justo después del rename, el archivo no queda vacío
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+def _read_map(map_path: Path) -> dict:
+    try:
+        data = _loads(map_path.read_bytes())
+    except Exception:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
 def _update_map(body: dict, map_path: Path) -> int:
     new_map = _extract_order_id_to_display(body)
     if not new_map:
         return 0
-    existing = {}
-    if map_path.exists():
-        try:
-            data = json.loads(map_path.read_text(encoding="utf-8"))
-            if isinstance(data, dict):
-                existing = data
-        except Exception:
-            pass
-    merged = {**existing, **new_map}
-    map_path.parent.mkdir(parents=True, exist_ok=True)
-    map_path.write_text(json.dumps(merged, ensure_ascii=False, indent=2), encoding="utf-8")
+    with _didi_maps_lock:
+        return _update_map_locked(new_map, map_path)
+
+
+def _update_map_locked(new_map: dict[str, str], map_path: Path) -> int:
+    # El mapa del día se queda en memoria; solo se relee si el archivo cambió por fuera (mtime/tamaño)
+    key = _stat_key(map_path)
+    cached = _didi_maps_cache.get(map_path)
+    if cached is not None and key is not None and cached[0] == key:
+        existing = cached[1]
+    else:
+        existing = _read_map(map_path) if key is not None else {}
+        _didi_maps_cache.clear()  # un mapa por día: los de días anteriores ya no se actualizan
+        _didi_maps_cache[map_path] = (key, existing)
+    added = {k: v for k, v in new_map.items() if existing.get(k) != v}
+    if not added:
+        # La extensión reenvía las mismas órdenes a menudo: sin cambios no se vuelve a serializar el mapa
+        return len(existing)
+    # Se fusiona en una copia: si la escritura falla, la cache sigue igual al disco y el próximo POST reintenta
+    merged = {**existing, **added}
+    _write_json_atomic(map_path, merged, indent=False)
+    _didi_maps_cache[map_path] = (_stat_key(map_path), merged)
     return len(merged)
 
 
@@ -96,7 +188,8 @@ async def daily_orders_payload(request: Request):
     maps_dir = _maps_dir(request)
     date_str = _now_colombia().strftime("%Y-%m-%d")
     map_path = maps_dir / f"didi_restaurant_map_{date_str}.json"
-    map_size = _update_map(body, map_path)
+    # Lectura/escritura (con fsync) del mapa fuera del event loop
+    map_size = await asyncio.to_thread(_update_map, body, map_path)
 
     # Disparar merge (restaurant_map + didi_restaurant_map) y notificar frontend
     on_merge = getattr(request.app.state, "on_didi_map_updated", None)
@@ -104,10 +197,11 @@ async def daily_orders_payload(request: Request):
         await on_merge(date_str)
 
     data = body.get("data") or {}
-    orders_count = len(data.get("serving") or []) + len(data.get("highlight") or [])
+    serving = data.get("serving") or []
+    orders_count = len(serving) + len(data.get("highlight") or [])
     shop_id = (body.get("shop_id") or "").strip()
-    if not shop_id and (data.get("serving") or []):
-        first = (data.get("serving") or [])[0]
+    if not shop_id and serving:
+        first = serving[0]
         if isinstance(first, dict):
             shop_id = str(first.get("shopId") or "").strip()
 
@@ -142,7 +236,7 @@ def _load_didi_persistent() -> None:
     if not _DIDI_PERSISTENT_PATH.exists():
         return
     try:
-        raw = json.loads(_DIDI_PERSISTENT_PATH.read_text(encoding="utf-8"))
+        raw = _loads(_DIDI_PERSISTENT_PATH.read_bytes())
         if isinstance(raw, dict):
             for k, v in raw.items():
                 if isinstance(v, dict) and "last_seen" in v and "data" in v:
@@ -151,23 +245,53 @@ def _load_didi_persistent() -> None:
         pass
 
 
-def _save_didi_persistent() -> None:
+def _didi_persistent_snapshot() -> dict:
+    """Copia del estado de heartbeats a guardar; se toma en el event loop, que es quien modifica _didi_sedes."""
+    return {k: {"last_seen": v["last_seen"], "data": v.get("data") or {}} for k, v in _didi_sedes.items()}
+
+
+def _save_didi_persistent(data: dict | None = None) -> None:
     """Guarda en disco el estado de heartbeats para que persista tras reiniciar el servidor."""
     try:
-        _DIDI_PERSISTENT_PATH.parent.mkdir(parents=True, exist_ok=True)
-        data = {k: {"last_seen": v["last_seen"], "data": v.get("data") or {}} for k, v in _didi_sedes.items()}
-        _DIDI_PERSISTENT_PATH.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+        if data is None:
+            data = _didi_persistent_snapshot()
+        _write_json_atomic(_DIDI_PERSISTENT_PATH, data)
     except Exception:
         pass
 
 
+def _flush_didi_persistent() -> None:
+    """Escribe el estado de heartbeats solo si hubo cambios desde la última escritura."""
+    global _didi_persistent_dirty
+    if not _didi_persistent_dirty:
+        return
+    _didi_persistent_dirty = False
+    _save_didi_persistent()
+
+
+async def _flush_didi_persistent_async() -> None:
+    """Como _flush_didi_persistent, pero la escritura (serializar + disco) va en un hilo y no frena el event loop."""
+    global _didi_persistent_dirty
+    if not _didi_persistent_dirty:
+        return
+    _didi_persistent_dirty = False
+    await asyncio.to_thread(_save_didi_persistent, _didi_persistent_snapshot())
+
+
 def _get_didi_blacklist() -> set[str]:
-    """ShopIds en la blacklist no se muestran (ni conectadas ni desconectadas)."""
+    """ShopIds en la blacklist no se muestran (ni conectadas ni desconectadas). Cacheado: no modificar el set."""
+    key = _stat_key(_DIDI_BLACKLIST_PATH)
+    cache = _didi_blacklist_cache
+    if cache["value"] is None or cache["key"] != key:
+        cache["value"] = _read_didi_blacklist() if key is not None else set()
+        cache["key"] = key
+    return cache["value"]
+
+
+def _read_didi_blacklist() -> set[str]:
     path = _DIDI_BLACKLIST_PATH
-    if not path.exists():
-        return set()
     try:
-        data = json.loads(path.read_text(encoding="utf-8"))
+        data = _loads(path.read_bytes())
         if isinstance(data, list):
             return {str(x).strip() for x in data if x}
         if isinstance(data, dict) and "shopIds" in data:
@@ -178,11 +302,20 @@ def _get_didi_blacklist() -> set[str]:
 
 
 def _load_didi_mapa() -> dict:
-    """Carga el mapa restaurant_id <-> didi shopId desde reports/didi/mapa_restaurant_didi.json."""
+    """Mapa restaurant_id <-> didi shopId (reports/didi/mapa_restaurant_didi.json). Cacheado: no modificar."""
+    key = _stat_key(_DIDI_MAPA_PATH)
+    cache = _didi_mapa_cache
+    if cache["value"] is None or cache["key"] != key:
+        cache["value"] = _read_didi_mapa()
+        cache["key"] = key
+    return cache["value"]
+
+
+def _read_didi_mapa() -> dict:
     if not _DIDI_MAPA_PATH.exists():
         return {"restaurant_id_to_didi": {}, "didi_to_restaurant_id": {}, "sedes": []}
     try:
-        data = json.loads(_DIDI_MAPA_PATH.read_text(encoding="utf-8"))
+        data = _loads(_DIDI_MAPA_PATH.read_bytes())
         if isinstance(data, dict):
             return data
     except Exception:
@@ -195,19 +328,22 @@ def _didi_sedes_list_payload() -> list[dict]:
     now = time.time()
     blacklist = _get_didi_blacklist()
     mapa = _load_didi_mapa()
-    # Sedes que han enviado al menos un heartbeat
-    out = [
-        {
+    didi_to_rest = mapa.get("didi_to_restaurant_id") or {}
+    # Sedes que han enviado al menos un heartbeat; conectada = último heartbeat después de este umbral
+    connected_after = now - _DIDI_STALE_SECONDS
+    out = []
+    for k, v in _didi_sedes.items():
+        if k in blacklist:
+            continue
+        last_seen = v["last_seen"]
+        out.append({
             "shopId": k,
             "shopName": (v.get("data") or {}).get("shopName") or k,
-            "lastSeen": v["last_seen"],
-            "connected": (now - v["last_seen"]) < _DIDI_STALE_SECONDS,
+            "lastSeen": last_seen,
+            "connected": last_seen > connected_after,
             "neverInstalled": False,
-            "restaurant_id": mapa.get("didi_to_restaurant_id") or {} and (mapa.get("didi_to_restaurant_id") or {}).get(k),
-        }
-        for k, v in _didi_sedes.items()
-        if k not in blacklist
-    ]
+            "restaurant_id": didi_to_rest.get(k),
+        })
     didi_ids_in_list = {s["shopId"] for s in out}
     # Añadir sedes del mapa que nunca han enviado heartbeat (neverInstalled)
     for s in mapa.get("sedes") or []:
@@ -228,24 +364,28 @@ def _didi_sedes_list_payload() -> list[dict]:
             "restaurant_id": str(rid),
         })
         didi_ids_in_list.add(didi_id)
-    # Asegurar restaurant_id en los que ya teníamos
-    for s in out:
-        if "restaurant_id" not in s or s.get("restaurant_id") is None:
-            s["restaurant_id"] = didi_to_rest.get(s["shopId"])
     return out
 
 
 async def _didi_sedes_broadcast() -> None:
-    dead = []
-    payload = _didi_sedes_list_payload()
-    for ws in _didi_ws_clients:
+    """Envía la lista a todos los clientes a la vez (uno lento no frena a los demás); quita los que fallan o no responden."""
+    targets = list(_didi_ws_clients)
+    if not targets:
+        return
+    # Mismo formato que send_json, codificado una vez para todos
+    msg = _json_bytes({"sedes": _didi_sedes_list_payload()}).decode("utf-8")
+
+    async def safe_send(ws: WebSocket) -> bool:
         try:
-            await ws.send_json({"sedes": payload})
+            await asyncio.wait_for(ws.send_text(msg), timeout=_DIDI_WS_SEND_TIMEOUT)
+            return True
         except Exception:
-            dead.append(ws)
-    for ws in dead:
-        if ws in _didi_ws_clients:
-            _didi_ws_clients.remove(ws)
+            return False
+
+    results = await asyncio.gather(*(safe_send(ws) for ws in targets))
+    for ws, ok in zip(targets, results):
+        if not ok:
+            _didi_ws_clients.discard(ws)
 
 
 @router.post("/didi/sede-heartbeat")
@@ -266,9 +406,10 @@ async def didi_sede_heartbeat(request: Request):
     shop_id = str(data.get("shopId") or "").strip()
     if not shop_id:
         raise HTTPException(status_code=400, detail="data.shopId es requerido")
+    global _didi_persistent_dirty
     now = time.time()
     _didi_sedes[shop_id] = {"last_seen": now, "data": data}
-    _save_didi_persistent()
+    _didi_persistent_dirty = True
     await _didi_sedes_broadcast()
     return {"ok": True, "shopId": shop_id}
 
@@ -279,7 +420,13 @@ def didi_mapa_restaurant():
     Mapa restaurant_id <-> didi shopId y lista de sedes.
     Ruta conveniente: reports/didi/mapa_restaurant_didi.json
     """
-    return _load_didi_mapa()
+    # Se serializa una vez por versión del archivo y se devuelven los bytes (sin pasar por jsonable_encoder)
+    key = _stat_key(_DIDI_MAPA_PATH)
+    cache = _didi_mapa_response_cache
+    if cache["body"] is None or cache["key"] != key:
+        cache["body"] = _json_bytes(_load_didi_mapa())
+        cache["key"] = key
+    return Response(content=cache["body"], media_type="application/json")
 
 
 @router.get("/didi/extension-status")
@@ -307,16 +454,15 @@ async def didi_sedes_websocket(websocket: WebSocket):
     Envía { "sedes": [ { shopId, shopName, lastSeen, connected } ] } al conectar y en cada cambio.
     """
     await websocket.accept()
-    _didi_ws_clients.append(websocket)
+    _didi_ws_clients.add(websocket)
     try:
-        await websocket.send_json({"sedes": _didi_sedes_list_payload()})
+        await websocket.send_text(_json_bytes({"sedes": _didi_sedes_list_payload()}).decode("utf-8"))
         while True:
             await asyncio.wait_for(websocket.receive_text(), timeout=300)
     except (WebSocketDisconnect, asyncio.TimeoutError):
         pass
     finally:
-        if websocket in _didi_ws_clients:
-            _didi_ws_clients.remove(websocket)
+        _didi_ws_clients.discard(websocket)
 
 
 # --- Política de privacidad (extensión Didi Food Capture) ---
@@ -388,8 +534,10 @@ async def run_didi_sedes_prune_loop() -> None:
     """Tarea que cada 5 s hace broadcast para actualizar estado conectada/desconectada. Las sedes no se eliminan."""
     while True:
         await asyncio.sleep(5)
+        await _flush_didi_persistent_async()
         await _didi_sedes_broadcast()
 
 
 # Al cargar el módulo, restaurar desde disco las sedes que ya habían enviado heartbeat
 _load_didi_persistent()
+atexit.register(_flush_didi_persistent)
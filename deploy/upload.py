@@ -1,5 +1,9 @@
 #!/usr/bin/env python3
-"""Sube .env.production y server.env.example al servidor por SFTP. Lee la clave de deploy/server.secret."""
+"""
+Sube .env.production y server.env.example al servidor por SFTP. Lee la clave de deploy/server.secret.
+Tras subir un archivo se le copia al remoto el mtime local; si luego el remoto tiene exactamente el mismo tamaño y
+mtime que el local, no se vuelve a subir. --force los sube todos.
+"""
 import os
 import sys
 
@@ -10,6 +14,7 @@ def main():
         print("Instala paramiko: pip install paramiko")
         sys.exit(1)
 
+    force = "--force" in sys.argv[1:]
     server = "104.248.177.53"
     user = "root"
     remote_path = "/var/www/restaurant_reports"
@@ -32,7 +37,10 @@ def main():
     ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
     try:
         ssh.connect(server, username=user, password=password, timeout=15)
-        sftp = ssh.open_sftp()
+        # Ventana y paquetes más grandes que los de open_sftp(): menos idas y vueltas por archivo
+        sftp = paramiko.SFTPClient.from_transport(
+            ssh.get_transport(), window_size=2 ** 27, max_packet_size=2 ** 15
+        )
         try:
             try:
                 sftp.stat(remote_path)
@@ -46,8 +54,24 @@ def main():
                 print(f"No existe: {local_path}")
                 continue
             remote_full = f"{remote_path}/{remote_name}"
+            local_st = os.stat(local_path)
+            try:
+                remote_st = sftp.stat(remote_full)
+            except IOError:
+                remote_st = None
+            if (
+                not force
+                and remote_st is not None
+                and remote_st.st_size == local_st.st_size
+                # SFTP guarda el mtime en segundos enteros; igualdad exacta, no comparación con el reloj del servidor
+                and remote_st.st_mtime == int(local_st.st_mtime)
+            ):
+                print(f"Sin cambios: {remote_name}")
+                continue
             print(f"Subiendo {remote_name}...")
-            sftp.put(local_path, remote_full)
+            with open(local_path, "rb") as f:
+                sftp.putfo(f, remote_full, file_size=local_st.st_size)
+            sftp.utime(remote_full, (local_st.st_atime, local_st.st_mtime))
         print("Listo.")
     except Exception as e:
         print(f"Error: {e}")
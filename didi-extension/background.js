@@ -7,14 +7,24 @@
 const ALARM_HEARTBEAT = "sedeHeartbeat";
 const HEARTBEAT_PERIOD_MINUTES = 0.5; // 30 segundos
 
+// URL del backend leída una vez por vida del worker; se vuelve a leer si el popup la cambia
+let baseUrlPromise = null;
+
 function getBaseUrl() {
-  return new Promise((resolve) => {
-    chrome.storage.sync.get({ backendUrl: "https://restaurant.reports.salchimonster.com" }, (o) => {
-      resolve(String(o.backendUrl || "https://restaurant.reports.salchimonster.com").replace(/\/$/, ""));
+  if (!baseUrlPromise) {
+    baseUrlPromise = new Promise((resolve) => {
+      chrome.storage.sync.get({ backendUrl: "https://restaurant.reports.salchimonster.com" }, (o) => {
+        resolve(String(o.backendUrl || "https://restaurant.reports.salchimonster.com").replace(/\/$/, ""));
+      });
     });
-  });
+  }
+  return baseUrlPromise;
 }
 
+chrome.storage.onChanged.addListener((changes, area) => {
+  if (area === "sync" && changes.backendUrl) baseUrlPromise = null;
+});
+
 async function sendSedeHeartbeat() {
   const { lastSedePayload } = await chrome.storage.local.get({ lastSedePayload: null });
   if (!lastSedePayload) return;
@@ -5,19 +5,20 @@
 (function () {
   const CAPTURE_URLS = ["getShops", "newOrders", "dailyOrders", "getShopByID"];
 
-  function shouldCapture(url) {
-    if (!url || typeof url !== "string") return false;
-    var u = url.toLowerCase();
-    return u.indexOf("getshops") >= 0 || u.indexOf("neworders") >= 0 || u.indexOf("dailyorders") >= 0 || u.indexOf("getshopbyid") >= 0;
-  }
+  // Una sola búsqueda (sin toLowerCase) decide si se captura y de qué tipo es
+  const CAPTURE_RE = /dailyorders|getshopbyid|getshops|neworders/i;
+  const TYPE_BY_MATCH = {
+    dailyorders: "dailyOrders",
+    getshopbyid: "getShopByID",
+    getshops: "getShops",
+    neworders: "newOrders",
+  };
 
+  // Tipo de captura de la URL, o null si no hay que capturarla
   function getType(url) {
-    var u = url.toLowerCase();
-    if (u.indexOf("dailyorders") >= 0) return "dailyOrders";
-    if (u.indexOf("getshopbyid") >= 0) return "getShopByID";
-    if (u.indexOf("getshops") >= 0) return "getShops";
-    if (u.indexOf("neworders") >= 0) return "newOrders";
-    return "unknown";
+    if (!url || typeof url !== "string") return null;
+    var m = CAPTURE_RE.exec(url);
+    return m ? TYPE_BY_MATCH[m[0].toLowerCase()] : null;
   }
 
   function sendCapture(type, url, data) {
@@ -36,7 +37,8 @@
     if (typeof input === "string") url = input;
     else if (input && input.url) url = input.url;
     else if (input && input instanceof Request) url = input.url;
-    if (!shouldCapture(url)) return origFetch.apply(this, args);
+    const type = getType(url);
+    if (!type) return origFetch.apply(this, args);
 
     return origFetch.apply(this, args).then(async (response) => {
       const clone = response.clone();
@@ -46,7 +48,7 @@
         const isJson = ct.includes("application/json") || /^\s*[{[]/.test(text);
         if (isJson && text) {
           const data = JSON.parse(text);
-          sendCapture(getType(url), url, data);
+          sendCapture(type, url, data);
         }
       } catch {}
       return response;
@@ -63,7 +65,8 @@
   XMLHttpRequest.prototype.send = function () {
     const xhr = this;
     const url = xhr._didiUrl || "";
-    if (shouldCapture(url)) {
+    const type = getType(url);
+    if (type) {
       xhr.addEventListener("load", function () {
         try {
           const txt = xhr.responseText;
@@ -71,7 +74,7 @@
           const isJson = ct.includes("application/json") || (txt && /^\s*[{[]/.test(txt));
           if (isJson && txt) {
             const data = JSON.parse(txt);
-            sendCapture(getType(url), url, data);
+            sendCapture(type, url, data);
           }
         } catch {}
       });
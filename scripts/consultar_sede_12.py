@@ -1,115 +1,293 @@
 #!/usr/bin/env python3
-"""Consulta deliverys de la sede 12 al API del restaurante y guarda en reports/deliverys/12/{fecha_consulta}.json.
-Ejecutar desde la raíz del proyecto: python3 scripts/consultar_sede_12.py
+"""Consulta deliverys de una o varias sedes al API del restaurante y guarda en reports/deliverys/{local_id}/{fecha_consulta}.json.
+Ejecutar desde la raíz del proyecto: python3 scripts/consultar_sede_12.py [local_id ...] [--pretty]
+Sin local_id consulta la sede 12. Varias sedes se piden a la vez en el mismo proceso y con el mismo cliente HTTP.
+El archivo se escribe compacto; --pretty lo deja indentado para leerlo a mano.
 """
+import asyncio
 import json
+import marshal
+import mmap
+import os
 import sys
-import urllib.request
+from datetime import datetime
+from itertools import chain
 from pathlib import Path
 
+import httpx
+
+try:
+    import orjson
+except ImportError:
+    orjson = None  # type: ignore
+
+# Zona horaria Colombia resuelta una vez (None si zoneinfo/tzdata no están disponibles)
+try:
+    from zoneinfo import ZoneInfo
+
+    _COLOMBIA_TZ = ZoneInfo("America/Bogota")
+except Exception:
+    _COLOMBIA_TZ = None
+
 ROOT = Path(__file__).resolve().parent.parent
 sys.path.insert(0, str(ROOT))
 
 from app.config import DELIVERY_API_BASE, DELIVERYS_CACHE_DIR, COOKIES_FILE, TOKEN_FILE
 
+# Mismo tamaño de página que usa la app: si el API recorta páginas más grandes, una página "corta" se
+# confundiría con la última y se perderían filas. Las páginas restantes ya se piden en paralelo.
+_PAGE_SIZE = 50
+_MAX_PER_LOCAL = 100
+_MAX_CONNECTIONS = 4
+_DEFAULT_LOCAL_IDS = ("12",)
+# Cabeceras fijas; en main() solo se agregan Authorization y Cookie, que dependen del token guardado
+_BASE_HEADERS = {"Accept": "application/json"}
+# Tope por página (50 filas caben de sobra): una respuesta anómala no se acumula entera en memoria
+_MAX_PAGE_BYTES = 32 * 1024 * 1024
+_READ_CHUNK_BYTES = 64 * 1024
+# Copia de las filas del día en formato marshal junto al JSON ({fecha}.json.marshal: la app solo lista *.json)
+_SIDECAR_SUFFIX = ".marshal"
+
+def _loads(raw: bytes | bytearray):
+    """JSON desde bytes (orjson si está instalado; si no, json sin decodificar aparte)."""
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
 def _read_json(path: Path, default):
     if not path.exists():
         return default
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return _loads(path.read_bytes())
+
+def _read_json_mmap(path: Path, default):
+    """Como _read_json, pero orjson parsea directo del mapeo del archivo (sin copiarlo antes a un bytes)."""
+    if orjson is None or not path.exists() or path.stat().st_size == 0:
+        return _read_json(path, default)
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        with memoryview(mm) as view:
+            return orjson.loads(view)
 
-def _write_json(path: Path, data: dict) -> None:
+def _write_json(path: Path, data: dict, pretty: bool = False) -> None:
+    """
+    Escribe en un temporal, lo sincroniza a disco y renombra: si el script se corta a mitad (o se solapan
+    dos ejecuciones), el archivo queda con la versión anterior o la nueva completa, nunca truncado.
+    """
     path.parent.mkdir(parents=True, exist_ok=True)
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if pretty else 0)
+        raw = orjson.dumps(data, option=option)
+    elif pretty:
+        raw = json.dumps(data, indent=2, ensure_ascii=False).encode("utf-8")
+    else:
+        raw = json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp, "wb") as f:
+            f.write(raw)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+def _stat_key(path: Path) -> tuple[int, int] | None:
+    """(mtime_ns, size) del archivo, o None si no existe."""
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+def _read_rows_sidecar(path: Path) -> list | None:
+    """
+    Filas del archivo del día desde su sidecar marshal, solo si se escribió para la versión actual del JSON
+    (misma clave de stat). Si no existe, está viejo (p. ej. la app reescribió el JSON) o no se puede leer: None.
+    """
+    key = _stat_key(path)
+    if key is None:
+        return None
+    try:
+        saved_key, rows = marshal.loads(path.with_name(path.name + _SIDECAR_SUFFIX).read_bytes())
+    except (OSError, ValueError, EOFError, TypeError):
+        return None
+    if saved_key != key or type(rows) is not list:
+        return None
+    return rows
+
+def _write_rows_sidecar(path: Path, rows: list) -> None:
+    """Guarda las filas en el sidecar marshal ligado al stat actual del JSON. Es solo caché: si falla, se ignora."""
+    key = _stat_key(path)
+    if key is None:
+        return
+    side = path.with_name(path.name + _SIDECAR_SUFFIX)
+    tmp = side.with_name(f"{side.name}.{os.getpid()}.tmp")
+    try:
+        tmp.write_bytes(marshal.dumps((key, rows)))
+        os.replace(tmp, side)
+    except (OSError, ValueError):
+        tmp.unlink(missing_ok=True)
+
+def _page_url(local_id: str, page: int, page_size: int) -> str:
+    offset = (page - 1) * page_size
+    return f"{DELIVERY_API_BASE}/obtenerDeliverysPorLocalSimple/{local_id}/{page}/{page_size}/{offset}"
+
+async def _fetch_page(client: httpx.AsyncClient, url: str):
+    """
+    Cuerpo JSON de una página, o None si falló (el error ya se imprimió).
+    El cuerpo se lee en streaming a un solo bytearray que se parsea directo, sin la copia a bytes de resp.content.
+    """
+    buf = bytearray()
+    try:
+        async with client.stream("GET", url) as resp:
+            if resp.status_code >= 400:
+                print(f"HTTP {resp.status_code}: {url}")
+                return None
+            # Una redirección que no se siguió no trae el JSON: se informa como error, no como página vacía
+            if 300 <= resp.status_code < 400:
+                print(f"HTTP {resp.status_code} (redirección sin seguir): {url}")
+                return None
+            async for chunk in resp.aiter_bytes(_READ_CHUNK_BYTES):
+                buf += chunk
+                if len(buf) > _MAX_PAGE_BYTES:
+                    print(f"Respuesta demasiado grande (> {_MAX_PAGE_BYTES} bytes): {url}")
+                    return None
+    except Exception as e:
+        print(f"Error de conexión: {e}")
+        return None
+    try:
+        return _loads(buf)
+    except ValueError as e:
+        print(f"Error de conexión: {e}")
+        return None
 
-def main():
+async def _fetch_deliverys(client: httpx.AsyncClient, local_id: str, page_size: int, max_per_local: int):
+    """
+    (filas, no_autorizado). La primera página sola dice si hay más; las que faltan hasta max_per_local
+    se piden a la vez con el mismo cliente y se procesan en orden, como si fueran secuenciales.
+    """
+    all_data = []
+    pages = [1]
+    while pages:
+        bodies = await asyncio.gather(*(_fetch_page(client, _page_url(local_id, p, page_size)) for p in pages))
+        for body in bodies:
+            if body is None:
+                return all_data, False
+            if isinstance(body, list):
+                all_data.extend(body)
+                return all_data[:max_per_local], False
+            if not isinstance(body, dict):
+                return all_data, False
+            if body.get("tipo") == "401":
+                return all_data, True
+            data = body.get("data")
+            if not data or not isinstance(data, list):
+                return all_data, False
+            all_data.extend(data)
+            if len(all_data) >= max_per_local:
+                return all_data[:max_per_local], False
+            if len(data) < page_size:
+                return all_data, False
+        next_page = pages[-1] + 1
+        missing = -(-(max_per_local - len(all_data)) // page_size)
+        pages = list(range(next_page, next_page + missing))
+    return all_data, False
+
+def _merge_rows(*sources: list) -> list:
+    """
+    Une filas de deliverys en orden de primera aparición, en una sola pasada por todas las fuentes.
+    Una fila con un delivery_id ya visto reemplaza a la anterior en su sitio; las que no tienen id se añaden.
+    """
+    rows: list = []
+    append = rows.append
+    pos_by_id: dict = {}
+    for r in chain.from_iterable(sources):
+        if type(r) is not dict:  # filas recién parseadas de JSON: siempre dict exacto
+            continue
+        did = r.get("delivery_id")
+        if not did or not (did := did.strip()):
+            # Sin id: se conserva tal cual, sin clave sintética ni búsqueda en el índice
+            append(r)
+            continue
+        pos = pos_by_id.get(did)
+        if pos is not None:
+            rows[pos] = r
+        else:
+            pos_by_id[did] = len(rows)
+            append(r)
+    return rows
+
+def _guardar_sede(local_id: str, all_data: list, fecha_hoy: str, fetched_at: str, pretty: bool) -> None:
+    """Fusiona las filas obtenidas con el archivo del día de la sede y lo reescribe si algo cambió."""
+    local_dir = DELIVERYS_CACHE_DIR / local_id
+    local_dir.mkdir(parents=True, exist_ok=True)
+    filepath = local_dir / f"{fecha_hoy}.json"
+    # El sidecar evita reparsear el JSON completo; si no vale, se lee el JSON como siempre
+    existing_list = _read_rows_sidecar(filepath)
+    from_sidecar = existing_list is not None
+    if not from_sidecar:
+        existing = _read_json_mmap(filepath, {})
+        existing_list = existing.get("data") if isinstance(existing, dict) else None
+        if not isinstance(existing_list, list):
+            existing_list = []
+    rows = _merge_rows(existing_list, all_data)
+    # Como en la app: si ninguna fila cambia respecto a lo que hay en disco no se reescribe
+    # (fetched_at queda en la última consulta con cambios). Sin archivo previo siempre se escribe.
+    if existing_list and rows == existing_list:
+        if not from_sidecar:
+            _write_rows_sidecar(filepath, rows)
+        print(f"Sede {local_id}: {len(all_data)} deliverys obtenidos, sin cambios ({len(rows)} en archivo).")
+        return
+    _write_json(filepath, {"fetched_at": fetched_at, "data": rows}, pretty=pretty)
+    _write_rows_sidecar(filepath, rows)
+    print(f"Sede {local_id}: {len(all_data)} deliverys obtenidos, {len(rows)} en archivo.")
+    print(f"Guardado: {filepath}")
+
+async def main():
     token_data = _read_json(TOKEN_FILE, {})
     token = token_data.get("token") if isinstance(token_data, dict) else None
     if not token:
         print("No hay token. Haz login primero (POST /login).")
         return 1
     cookies_list = _read_json(COOKIES_FILE, [])
-    cookie_header = "; ".join(f"{c['name']}={c['value']}" for c in cookies_list if isinstance(c, dict) and c.get("name") and c.get("value"))
+    cookie_header = "; ".join([
+        f"{name}={value}"
+        for c in cookies_list if isinstance(c, dict)
+        if (name := c.get("name")) and (value := c.get("value"))
+    ])
 
-    headers = {"Authorization": f'Token token="{token}"', "Accept": "application/json"}
+    headers = {**_BASE_HEADERS, "Authorization": f'Token token="{token}"'}
     if cookie_header:
         headers["Cookie"] = cookie_header
-    local_id = "12"
-    page = 1
-    page_size = 50
-    offset = 0
-    all_data = []
-    max_per_local = 100
-
-    while len(all_data) < max_per_local:
-        url = f"{DELIVERY_API_BASE}/obtenerDeliverysPorLocalSimple/{local_id}/{page}/{page_size}/{offset}"
-        req = urllib.request.Request(url, headers=headers, method="GET")
-        try:
-            with urllib.request.urlopen(req, timeout=60) as resp:
-                body = json.loads(resp.read().decode("utf-8"))
-        except urllib.error.HTTPError as e:
-            print(f"HTTP {e.code}: {url}")
-            break
-        except Exception as e:
-            print(f"Error de conexión: {e}")
-            break
-        if isinstance(body, list):
-            all_data.extend(body)
-            if len(all_data) > max_per_local:
-                all_data = all_data[:max_per_local]
-            break
-        if not isinstance(body, dict):
-            break
-        if body.get("tipo") == "401":
-            print("No autorizado (token inválido o expirado).")
-            return 1
-        data = body.get("data") if isinstance(body.get("data"), list) else []
-        if not data:
-            break
-        all_data.extend(data)
-        if len(all_data) >= max_per_local:
-            all_data = all_data[:max_per_local]
-            break
-        if len(data) < page_size:
-            break
-        offset += page_size
-        page += 1
-
-    # Fecha de hoy (Colombia) para el nombre del archivo
-    try:
-        from zoneinfo import ZoneInfo
-        from datetime import datetime
-        tz = ZoneInfo("America/Bogota")
-        fecha_hoy = datetime.now(tz).strftime("%Y-%m-%d")
-        fetched_at = datetime.now(tz).strftime("%Y-%m-%d %H:%M:%S") + " (Colombia)"
-    except Exception:
-        from datetime import datetime
-        fecha_hoy = datetime.utcnow().strftime("%Y-%m-%d")
-        fetched_at = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S") + " (UTC)"
+    args = sys.argv[1:]
+    local_ids = list(dict.fromkeys(a for a in args if not a.startswith("--"))) or list(_DEFAULT_LOCAL_IDS)
 
-    local_dir = DELIVERYS_CACHE_DIR / local_id
-    local_dir.mkdir(parents=True, exist_ok=True)
-    filepath = local_dir / f"{fecha_hoy}.json"
-    existing = _read_json(filepath, {})
-    existing_list = existing.get("data", []) if isinstance(existing.get("data"), list) else []
-    by_id = {}
-    for i, r in enumerate(existing_list):
-        if isinstance(r, dict):
-            did = (r.get("delivery_id") or "").strip()
-            by_id[did or f"__{i}"] = r
-    for r in all_data:
-        if isinstance(r, dict):
-            did = (r.get("delivery_id") or "").strip()
-            if did:
-                by_id[did] = r
-            else:
-                by_id[f"__new_{len(by_id)}"] = r
-    out = {"fetched_at": fetched_at, "data": list(by_id.values())}
-    _write_json(filepath, out)
-    print(f"Sede 12: {len(all_data)} deliverys obtenidos, {len(out['data'])} en archivo.")
-    print(f"Guardado: {filepath}")
+    # Un solo cliente para todas las sedes y páginas: DNS/TCP/TLS una vez y conexiones keep-alive reutilizadas.
+    # Se limita cuántas conexiones abre a la vez la ráfaga de páginas, y se siguen redirecciones como hacía urlopen.
+    limits = httpx.Limits(max_connections=_MAX_CONNECTIONS, max_keepalive_connections=_MAX_CONNECTIONS)
+    async with httpx.AsyncClient(headers=headers, timeout=60, limits=limits, follow_redirects=True) as client:
+        results = await asyncio.gather(
+            *(_fetch_deliverys(client, local_id, _PAGE_SIZE, _MAX_PER_LOCAL) for local_id in local_ids)
+        )
+    if any(unauthorized for _, unauthorized in results):
+        print("No autorizado (token inválido o expirado).")
+        return 1
+
+    # Fecha de hoy (Colombia) para el nombre del archivo; un solo now() para fecha y fetched_at
+    if _COLOMBIA_TZ is not None:
+        now = datetime.now(_COLOMBIA_TZ)
+        tz_label = " (Colombia)"
+    else:
+        now = datetime.utcnow()
+        tz_label = " (UTC)"
+    # isoformat sin parsear formato; now.time() descarta el offset para que quede 'YYYY-MM-DD HH:MM:SS'
+    fecha_hoy = now.date().isoformat()
+    fetched_at = f"{fecha_hoy} {now.time().isoformat('seconds')}{tz_label}"
+
+    pretty = "--pretty" in args
+    for local_id, (all_data, _) in zip(local_ids, results):
+        _guardar_sede(local_id, all_data, fecha_hoy, fetched_at, pretty)
     return 0
 
 if __name__ == "__main__":
-    sys.exit(main())
+    sys.exit(asyncio.run(main()))